@@ -0,0 +1,48 @@
+import asyncio
+
+from app.database import engine, dialect_insert, AsyncSessionLocal, DB_PATH, Grammar
+from app.migrations import run_migrations
+from app.services.grammar_catalog import grammar_catalog
+from app.services.exercise_pool import exercise_pool
+from app.services.export_jobs import export_jobs
+from app.services.openai_service import openai_service
+from app.utils.grammar_data import get_initial_grammar_data
+
+# The single startup phase: schema, seed data, catalog, background workers.
+# Safe to call more than once; later calls wait for the first and return.
+_bootstrapped = False
+_lock = asyncio.Lock()
+
+async def seed_grammar():
+    # One insert that skips grammar points already present, so concurrent
+    # workers can't collide and existing rows are never overwritten
+    async with AsyncSessionLocal() as db:
+        await db.execute(
+            dialect_insert(Grammar).on_conflict_do_nothing(index_elements=[Grammar.id]),
+            get_initial_grammar_data()
+        )
+        await db.commit()
+
+        await grammar_catalog.load(db)
+
+async def bootstrap():
+    global _bootstrapped
+    async with _lock:
+        if _bootstrapped:
+            return
+
+        if engine.dialect.name == "sqlite":
+            DB_PATH.parent.mkdir(parents=True, exist_ok=True)
+
+        await run_migrations(engine)
+        await seed_grammar()
+        exercise_pool.start()
+        _bootstrapped = True
+
+async def shutdown():
+    global _bootstrapped
+    async with _lock:
+        await exercise_pool.stop()
+        await export_jobs.stop()
+        await openai_service.close()
+        _bootstrapped = False
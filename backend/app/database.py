@@ -1,9 +1,14 @@
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import declarative_base, sessionmaker
-from sqlalchemy import Column, Integer, String, Float, DateTime, Text, JSON
+from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, Text, JSON, Index, event, func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool
 import os
+import random
+import time
 from dotenv import load_dotenv
-from datetime import datetime
+from datetime import datetime, timedelta
 from pathlib import Path
 
 load_dotenv()
@@ -14,10 +19,82 @@ DB_PATH = PROJECT_ROOT / "data" / "manaboo.db"
 
 DATABASE_URL = os.getenv("DATABASE_URL", f"sqlite+aiosqlite:///{DB_PATH}")
 
-engine = create_async_engine(DATABASE_URL, echo=True)
+DB_ECHO = os.getenv("DB_ECHO", "false").lower() == "true"
+# Fraction of statements printed with their duration; cheap sampling instead of echo
+DB_LOG_SAMPLE_RATE = float(os.getenv("DB_LOG_SAMPLE_RATE", "0"))
+# SQLite allows one writer at a time, so a few pooled connections queueing
+# in-process beat many connections spinning in the busy handler.
+# DB_POOL_SIZE=0 opens a fresh connection per session instead.
+_IS_SQLITE = DATABASE_URL.startswith("sqlite")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "4" if _IS_SQLITE else "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "0" if _IS_SQLITE else "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+
+# PRAGMAs run on every new SQLite connection. "tuned" lets readers and the
+# single writer proceed concurrently (WAL), waits on locks instead of failing,
+# and skips an fsync per commit; "default" keeps SQLite's own settings.
+SQLITE_PROFILES = {
+    "tuned": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "busy_timeout": "5000",
+        "cache_size": "-20000",
+        "temp_store": "MEMORY",
+        "wal_autocheckpoint": "1000",
+    },
+    "default": {},
+}
+DB_SQLITE_PROFILE = os.getenv("DB_SQLITE_PROFILE", "tuned")
+
+def _engine_options(url: str) -> dict:
+    options = {"echo": DB_ECHO}
+    
+    if DB_POOL_SIZE <= 0:
+        options["poolclass"] = NullPool
+    elif make_url(url).database in (None, "", ":memory:"):
+        pass
+    else:
+        # aiosqlite would otherwise default to NullPool for file databases
+        options.update(
+            poolclass=AsyncAdaptedQueuePool,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_pre_ping=not _IS_SQLITE
+        )
+    return options
+
+engine = create_async_engine(DATABASE_URL, **_engine_options(DATABASE_URL))
+
+if engine.dialect.name == "sqlite":
+    @event.listens_for(engine.sync_engine, "connect")
+    def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in SQLITE_PROFILES[DB_SQLITE_PROFILE].items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+if DB_LOG_SAMPLE_RATE > 0:
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def _sample_statement(conn, cursor, statement, parameters, context, executemany):
+        if random.random() < DB_LOG_SAMPLE_RATE:
+            conn.info["sampled_at"] = time.perf_counter()
+        else:
+            conn.info.pop("sampled_at", None)
+    
+    @event.listens_for(engine.sync_engine, "after_cursor_execute")
+    def _log_sampled_statement(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.pop("sampled_at", None)
+        if started is not None:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            print(f"SQL {elapsed_ms:.1f}ms: {' '.join(statement.split())[:500]}")
+
 AsyncSessionLocal = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 Base = declarative_base()
 
+# JSON on SQLite, indexable JSONB on PostgreSQL
+JSONType = JSON().with_variant(postgresql.JSONB(), "postgresql")
+
 class Grammar(Base):
     __tablename__ = "grammar"
     
@@ -26,8 +103,13 @@ class Grammar(Base):
     title = Column(String)
     structure = Column(String)
     usage = Column(Text)
-    examples = Column(JSON)
-    themes = Column(JSON)
+    examples = Column(JSONType)
+    themes = Column(JSONType)
+    
+    __table_args__ = (
+        # Serves themes @> '["..."]' containment queries; PostgreSQL only
+        Index("ix_grammar_themes", "themes", postgresql_using="gin").ddl_if(dialect="postgresql"),
+    )
 
 class Exercise(Base):
     __tablename__ = "exercises"
@@ -36,10 +118,14 @@ class Exercise(Base):
     grammar_id = Column(String)
     type = Column(String)
     question = Column(Text)
-    options = Column(JSON)
+    options = Column(JSONType)
     correct_answer = Column(String)
     explanation = Column(Text)
     created_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        Index("ix_exercises_grammar_type", "grammar_id", "type"),
+    )
 
 class Mistake(Base):
     __tablename__ = "mistakes"
@@ -51,6 +137,11 @@ class Mistake(Base):
     user_answer = Column(Text)
     correct_answer = Column(Text)
     timestamp = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        Index("ix_mistakes_user_timestamp", "user_id", "timestamp"),
+        Index("ix_mistakes_user_grammar_timestamp", "user_id", "grammar_id", "timestamp"),
+    )
 
 class UserProficiency(Base):
     __tablename__ = "user_proficiency"
@@ -62,6 +153,18 @@ class UserProficiency(Base):
     correct_count = Column(Integer, default=0)
     proficiency_score = Column(Float, default=0.0)
     last_practiced = Column(DateTime, default=datetime.utcnow)
+    # Spaced-repetition state, see services/review_schedule.py
+    ease = Column(Float, default=2.5)
+    interval_days = Column(Float, default=0.0)
+    repetitions = Column(Integer, default=0)
+    due_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        Index("uq_user_proficiency_user_grammar", "user_id", "grammar_id", unique=True),
+        Index("ix_user_proficiency_user_score", "user_id", "proficiency_score"),
+        Index("ix_user_proficiency_user_practiced", "user_id", "last_practiced"),
+        Index("ix_user_proficiency_user_due", "user_id", "due_at"),
+    )
 
 class DialogueSession(Base):
     __tablename__ = "dialogue_sessions"
@@ -69,9 +172,34 @@ class DialogueSession(Base):
     id = Column(String, primary_key=True)
     user_id = Column(String)
     scenario = Column(String)
-    history = Column(JSON)
+    # Legacy JSON transcript; messages now live in dialogue_messages
+    history = Column(JSONType)
+    # Highest seq handed out in dialogue_messages for this session
+    message_count = Column(Integer, default=0)
+    # Rolling summary of every message up to summarized_through_seq
+    summary = Column(Text)
+    summarized_through_seq = Column(Integer, default=0)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (
+        Index("ix_dialogue_sessions_user_updated", "user_id", "updated_at"),
+    )
+
+class DialogueMessage(Base):
+    __tablename__ = "dialogue_messages"
+    
+    # Append-only transcript; seq is 1-based and contiguous within a session
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    session_id = Column(String)
+    seq = Column(Integer)
+    role = Column(String)
+    text = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        Index("uq_dialogue_messages_session_seq", "session_id", "seq", unique=True),
+    )
 
 class StudyStats(Base):
     __tablename__ = "study_stats"
@@ -82,6 +210,104 @@ class StudyStats(Base):
     grammar_count = Column(Integer, default=0)
     dialogue_count = Column(Integer, default=0)
     total_time_minutes = Column(Integer, default=0)
+    # Daily rollup columns, kept up to date by services/study_stats.py
+    mistake_count = Column(Integer, default=0)
+    mastered_count = Column(Integer, default=0)
+    new_grammar_count = Column(Integer, default=0)
+    new_session_count = Column(Integer, default=0)
+    total_time_seconds = Column(Integer, default=0)
+    last_activity_at = Column(DateTime)
+    
+    __table_args__ = (
+        Index("uq_study_stats_user_date", "user_id", "date", unique=True),
+    )
+
+class PracticeEvent(Base):
+    __tablename__ = "practice_events"
+    
+    # Append-only activity log: one row per graded answer or dialogue turn
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(String)
+    kind = Column(String)
+    grammar_id = Column(String)
+    session_id = Column(String)
+    correct = Column(Boolean)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        Index("ix_practice_events_user_created", "user_id", "created_at"),
+    )
+
+class LLMCacheEntry(Base):
+    __tablename__ = "llm_cache"
+    
+    key = Column(String, primary_key=True)
+    method = Column(String)
+    model = Column(String)
+    prompt_version = Column(String)
+    response = Column(JSONType)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    last_accessed = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        Index("ix_llm_cache_last_accessed", "last_accessed"),
+        Index("ix_llm_cache_created_at", "created_at"),
+    )
+
+class DialogueCorrection(Base):
+    __tablename__ = "dialogue_corrections"
+    
+    # A correction that missed the reply deadline. The worker running it fills
+    # in the result; whichever worker the client polls reads it from here.
+    id = Column(String, primary_key=True)
+    message = Column(Text)
+    correction = Column(JSONType)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    finished_at = Column(DateTime)
+    
+    __table_args__ = (
+        Index("ix_dialogue_corrections_created_at", "created_at"),
+    )
+
+class ExportJob(Base):
+    __tablename__ = "export_jobs"
+    
+    # Shared by every worker: whichever one takes the job runs it, any one can
+    # answer polls and downloads. The file lives in the shared EXPORT_DIR.
+    id = Column(String, primary_key=True)
+    user_id = Column(String)
+    status = Column(String, default="queued")
+    # Fingerprint of the user's study data when the job was submitted
+    data_version = Column(String)
+    rows_written = Column(Integer, default=0)
+    rows_total = Column(Integer)
+    path = Column(String)
+    error = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    # Bumped while the job waits or runs; a stale heartbeat means its worker is gone
+    heartbeat_at = Column(DateTime, default=datetime.utcnow)
+    finished_at = Column(DateTime)
+    
+    __table_args__ = (
+        Index("ix_export_jobs_user_created", "user_id", "created_at"),
+    )
+
+def dialect_insert(model):
+    # INSERT that supports on_conflict_do_update/on_conflict_do_nothing for the active backend
+    if engine.dialect.name == "postgresql":
+        return postgresql.insert(model)
+    return sqlite.insert(model)
+
+def seconds_between(later, earlier):
+    if engine.dialect.name == "postgresql":
+        return func.extract("epoch", later - earlier)
+    return (func.julianday(later) - func.julianday(earlier)) * 86400
+
+def shifted_date(column, minutes: int):
+    # YYYY-MM-DD string of a timestamp moved by a fixed number of minutes
+    if engine.dialect.name == "postgresql":
+        return func.to_char(column + timedelta(minutes=minutes), "YYYY-MM-DD")
+    return func.date(column, f"{minutes:+d} minutes")
 
 async def get_db():
     async with AsyncSessionLocal() as session:
@@ -1,8 +1,16 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from app.routers import grammar, dialogue, stats
-from app.database import engine, Base
-import asyncio
+from app.bootstrap import bootstrap, shutdown as bootstrap_shutdown
+from app.database import engine
+from app.services import metrics
+from app.services.openai_service import openai_service
+from app.services.exercise_pool import exercise_pool
+from app.services.llm_cache import llm_cache
+from app.services.export_jobs import export_jobs
+from app.routers.stats import summary_cache
+import time
 
 app = FastAPI(title="Manaboo API", version="1.0.0")
 
@@ -12,20 +20,56 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
+metrics.instrument_engine(engine.sync_engine)
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    stats = metrics.start_request()
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # Label by route template so path parameters don't explode the series count
+        route = request.scope.get("route")
+        metrics.observe_request(
+            request.method,
+            route.path if route else "unmatched",
+            status,
+            time.perf_counter() - started,
+            stats
+        )
+
 app.include_router(grammar.router, prefix="/api")
 app.include_router(dialogue.router, prefix="/api")
 app.include_router(stats.router, prefix="/api")
 
 @app.on_event("startup")
 async def startup():
-    from app.database import DB_PATH
-    # Ensure the database directory exists
-    DB_PATH.parent.mkdir(parents=True, exist_ok=True)
-    
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+    await bootstrap()
+
+@app.on_event("shutdown")
+async def shutdown():
+    await bootstrap_shutdown()
+
+@app.get("/api/llm/metrics")
+async def llm_metrics():
+    return {
+        **openai_service.get_metrics(),
+        "cache": llm_cache.get_metrics(),
+        "exercise_pool": exercise_pool.get_metrics(),
+        "summary_cache": summary_cache.get_metrics(),
+        "export_jobs": export_jobs.get_metrics()
+    }
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
 @app.get("/")
 def read_root():
@@ -0,0 +1,277 @@
+from datetime import datetime
+from typing import Callable, List, Optional, Tuple
+
+from collections import defaultdict
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, select, update, delete, func, and_, inspect, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.database import Base, DialogueCorrection, DialogueMessage, DialogueSession, ExportJob, Mistake, PracticeEvent, StudyStats, UserProficiency
+
+# Applied migrations are recorded here; each one runs exactly once per database
+schema_version = Table(
+    "schema_version",
+    MetaData(),
+    Column("version", Integer, primary_key=True),
+    Column("name", String),
+    Column("applied_at", DateTime, default=datetime.utcnow),
+)
+
+def _create_index(conn: Connection, name: str, table_name: str, *column_names: str, unique: bool = False, using: Optional[str] = None):
+    # Spelled out per migration rather than read from the models, which already
+    # describe the latest schema and may index columns this step predates
+    quote = conn.dialect.identifier_preparer.quote
+    conn.execute(text(
+        f"CREATE {'UNIQUE ' if unique else ''}INDEX IF NOT EXISTS {quote(name)} ON {quote(table_name)}"
+        f"{f' USING {using}' if using else ''} ({', '.join(quote(c) for c in column_names)})"
+    ))
+
+def _add_columns(conn: Connection, table_name: str, *column_names: str):
+    # ALTER TABLE ... ADD COLUMN for model columns the live table doesn't have yet
+    existing = {c["name"] for c in inspect(conn).get_columns(table_name)}
+    table = Base.metadata.tables[table_name]
+    
+    for name in column_names:
+        if name in existing:
+            continue
+        column = table.c[name]
+        column_type = column.type.compile(dialect=conn.dialect)
+        conn.execute(text(f'ALTER TABLE {table_name} ADD COLUMN {name} {column_type}'))
+
+def _merge_duplicate_proficiency(conn: Connection):
+    # Concurrent first submits used to insert one row each; fold them together
+    duplicates = conn.execute(
+        select(
+            UserProficiency.user_id,
+            UserProficiency.grammar_id,
+            func.max(UserProficiency.id),
+            func.sum(UserProficiency.practice_count),
+            func.sum(UserProficiency.correct_count),
+            func.max(UserProficiency.last_practiced)
+        ).group_by(
+            UserProficiency.user_id,
+            UserProficiency.grammar_id
+        ).having(func.count(UserProficiency.id) > 1)
+    ).all()
+
+    for user_id, grammar_id, keep_id, practice_count, correct_count, last_practiced in duplicates:
+        conn.execute(
+            update(UserProficiency).where(UserProficiency.id == keep_id).values(
+                practice_count=practice_count,
+                correct_count=correct_count,
+                proficiency_score=(correct_count / practice_count * 100) if practice_count else 0.0,
+                last_practiced=last_practiced
+            )
+        )
+        conn.execute(
+            delete(UserProficiency).where(
+                and_(
+                    UserProficiency.user_id == user_id,
+                    UserProficiency.grammar_id == grammar_id,
+                    UserProficiency.id != keep_id
+                )
+            )
+        )
+
+def _001_per_user_indexes(conn: Connection):
+    _merge_duplicate_proficiency(conn)
+    _create_index(conn, "ix_exercises_grammar_type", "exercises", "grammar_id", "type")
+    _create_index(conn, "ix_mistakes_user_timestamp", "mistakes", "user_id", "timestamp")
+    _create_index(conn, "ix_mistakes_user_grammar", "mistakes", "user_id", "grammar_id")
+    _create_index(conn, "uq_user_proficiency_user_grammar", "user_proficiency", "user_id", "grammar_id", unique=True)
+    _create_index(conn, "ix_user_proficiency_user_score", "user_proficiency", "user_id", "proficiency_score")
+    _create_index(conn, "ix_user_proficiency_user_practiced", "user_proficiency", "user_id", "last_practiced")
+    _create_index(conn, "ix_dialogue_sessions_user_updated", "dialogue_sessions", "user_id", "updated_at")
+    _create_index(conn, "uq_study_stats_user_date", "study_stats", "user_id", "date", unique=True)
+    _create_index(conn, "ix_llm_cache_last_accessed", "llm_cache", "last_accessed")
+    _create_index(conn, "ix_llm_cache_created_at", "llm_cache", "created_at")
+
+def _002_practice_events(conn: Connection):
+    PracticeEvent.__table__.create(conn, checkfirst=True)
+
+def _003_study_stats_rollups(conn: Connection):
+    _add_columns(
+        conn,
+        "study_stats",
+        "mistake_count",
+        "mastered_count",
+        "new_grammar_count",
+        "new_session_count",
+        "total_time_seconds",
+        "last_activity_at"
+    )
+    
+    # Rebuild the rollups from the history we already have
+    rollups = defaultdict(lambda: defaultdict(int))
+    
+    def add(rows, field):
+        for user_id, day, count in rows:
+            if user_id is not None and day is not None:
+                rollups[(user_id, str(day)[:10])][field] += count
+    
+    def per_day(column, *where):
+        day = func.date(column)
+        table = column.class_
+        return conn.execute(
+            select(table.user_id, day, func.count()).where(*where).group_by(table.user_id, day)
+        ).all()
+    
+    add(per_day(PracticeEvent.created_at, PracticeEvent.kind == "grammar"), "grammar_count")
+    add(per_day(PracticeEvent.created_at, PracticeEvent.kind == "dialogue"), "dialogue_count")
+    add(per_day(Mistake.timestamp), "mistake_count")
+    add(per_day(UserProficiency.last_practiced), "new_grammar_count")
+    add(per_day(UserProficiency.last_practiced, UserProficiency.proficiency_score >= 80), "mastered_count")
+    add(per_day(DialogueSession.created_at), "new_session_count")
+    
+    conn.execute(delete(StudyStats))
+    for (user_id, day), counts in rollups.items():
+        conn.execute(StudyStats.__table__.insert().values(
+            user_id=user_id,
+            date=datetime.strptime(day, "%Y-%m-%d"),
+            grammar_count=counts["grammar_count"],
+            dialogue_count=counts["dialogue_count"],
+            total_time_minutes=0,
+            mistake_count=counts["mistake_count"],
+            mastered_count=counts["mastered_count"],
+            new_grammar_count=counts["new_grammar_count"],
+            new_session_count=counts["new_session_count"],
+            total_time_seconds=0
+        ))
+
+def _004_dialogue_messages(conn: Connection):
+    DialogueMessage.__table__.create(conn, checkfirst=True)
+    _add_columns(conn, "dialogue_sessions", "message_count")
+    
+    # Copy each JSON transcript into rows, a page of sessions at a time
+    last_id = ""
+    while True:
+        sessions = conn.execute(
+            select(DialogueSession.id, DialogueSession.history, DialogueSession.updated_at)
+            .where(DialogueSession.id > last_id)
+            .order_by(DialogueSession.id)
+            .limit(500)
+        ).all()
+        if not sessions:
+            break
+        
+        for session_id, history, updated_at in sessions:
+            messages = [m for m in (history or []) if isinstance(m, dict)]
+            if messages:
+                conn.execute(DialogueMessage.__table__.insert(), [
+                    {
+                        "session_id": session_id,
+                        "seq": seq,
+                        "role": m.get("role"),
+                        "text": m.get("text"),
+                        "created_at": updated_at
+                    }
+                    for seq, m in enumerate(messages, start=1)
+                ])
+            conn.execute(
+                update(DialogueSession.__table__)
+                .where(DialogueSession.__table__.c.id == session_id)
+                .values(message_count=len(messages), updated_at=updated_at)
+            )
+        last_id = sessions[-1][0]
+
+def _005_dialogue_summaries(conn: Connection):
+    _add_columns(conn, "dialogue_sessions", "summary", "summarized_through_seq")
+
+def _006_postgres_json(conn: Connection):
+    # JSON columns become JSONB so grammar themes can carry a GIN index
+    if conn.dialect.name != "postgresql":
+        return
+    for table_name, column_name in [
+        ("grammar", "examples"),
+        ("grammar", "themes"),
+        ("exercises", "options"),
+        ("dialogue_sessions", "history"),
+        ("llm_cache", "response"),
+    ]:
+        conn.execute(text(
+            f"ALTER TABLE {table_name} ALTER COLUMN {column_name} TYPE JSONB USING {column_name}::jsonb"
+        ))
+    _create_index(conn, "ix_grammar_themes", "grammar", "themes", using="gin")
+
+def _007_mistake_grammar_timestamp(conn: Connection):
+    # Per-grammar mistake pages read newest first; the wider index replaces the old one
+    _create_index(conn, "ix_mistakes_user_grammar_timestamp", "mistakes", "user_id", "grammar_id", "timestamp")
+    conn.execute(text("DROP INDEX IF EXISTS ix_mistakes_user_grammar"))
+
+def _008_review_schedule(conn: Connection):
+    _add_columns(conn, "user_proficiency", "ease", "interval_days", "repetitions", "due_at")
+    # Existing points start a fresh schedule, due from when they were last practiced
+    conn.execute(
+        update(UserProficiency.__table__)
+        .where(UserProficiency.__table__.c.due_at.is_(None))
+        .values(
+            ease=2.5,
+            interval_days=0.0,
+            repetitions=0,
+            due_at=func.coalesce(UserProficiency.__table__.c.last_practiced, datetime.utcnow())
+        )
+    )
+    _create_index(conn, "ix_user_proficiency_user_due", "user_proficiency", "user_id", "due_at")
+
+def _009_export_jobs(conn: Connection):
+    ExportJob.__table__.create(conn, checkfirst=True)
+
+def _010_dialogue_corrections(conn: Connection):
+    DialogueCorrection.__table__.create(conn, checkfirst=True)
+
+MIGRATIONS: List[Tuple[int, str, Callable[[Connection], None]]] = [
+    (1, "per_user_indexes", _001_per_user_indexes),
+    (2, "practice_events", _002_practice_events),
+    (3, "study_stats_rollups", _003_study_stats_rollups),
+    (4, "dialogue_messages", _004_dialogue_messages),
+    (5, "dialogue_summaries", _005_dialogue_summaries),
+    (6, "postgres_json", _006_postgres_json),
+    (7, "mistake_grammar_timestamp", _007_mistake_grammar_timestamp),
+    (8, "review_schedule", _008_review_schedule),
+    (9, "export_jobs", _009_export_jobs),
+    (10, "dialogue_corrections", _010_dialogue_corrections),
+]
+
+# Arbitrary key for the PostgreSQL advisory lock that serializes startup across workers
+MIGRATION_LOCK_KEY = 4_270_517
+
+def _lock(conn: Connection):
+    # Held until the migration transaction ends; later workers wait, then find
+    # nothing left to do
+    if conn.dialect.name == "postgresql":
+        conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
+    elif conn.dialect.name == "sqlite":
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+
+def _migrate(conn: Connection):
+    _lock(conn)
+    
+    fresh = not inspect(conn).has_table("grammar")
+    schema_version.create(conn, checkfirst=True)
+    current = conn.execute(select(func.max(schema_version.c.version))).scalar() or 0
+    
+    if fresh:
+        # New database: build the current schema directly and mark every migration applied
+        Base.metadata.create_all(conn)
+        conn.execute(schema_version.insert(), [
+            {"version": version, "name": name, "applied_at": datetime.utcnow()}
+            for version, name, _ in MIGRATIONS
+        ])
+        print(f"Created schema at version {MIGRATIONS[-1][0]:03d}")
+        return
+    
+    if current == 0:
+        # Database from before versioned migrations: add the tables it predates,
+        # then let every migration bring the existing ones up to date
+        Base.metadata.create_all(conn)
+    
+    for version, name, migration in MIGRATIONS:
+        if version <= current:
+            continue
+        migration(conn)
+        conn.execute(schema_version.insert().values(version=version, name=name, applied_at=datetime.utcnow()))
+        print(f"Applied migration {version:03d}_{name}")
+
+async def run_migrations(engine: AsyncEngine):
+    async with engine.begin() as conn:
+        await conn.run_sync(_migrate)
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any
 from datetime import datetime
 
@@ -11,6 +11,9 @@ class SubmitAnswerRequest(BaseModel):
     questionId: str
     userAnswer: str
 
+class BatchSubmitRequest(BaseModel):
+    answers: List[SubmitAnswerRequest] = Field(min_length=1, max_length=50)
+
 class GrammarFilter(BaseModel):
     level: Optional[str] = None
     theme: Optional[str] = None
@@ -48,6 +51,8 @@ class DialogueResponse(BaseModel):
     reply: str
     sessionId: str
     correction: Optional[Dict[str, str]] = None
+    correctionPending: bool = False
+    correctionId: Optional[str] = None
 
 class CorrectionRequest(BaseModel):
     message: str
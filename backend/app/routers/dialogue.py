@@ -1,16 +1,40 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import Response, StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, and_
-from typing import List, Dict
+from sqlalchemy import select, and_, delete, or_
+from typing import List, Dict, Optional, Tuple
+from datetime import datetime, timedelta
+import asyncio
+import json
+import os
 import uuid
-from datetime import datetime
 
-from app.database import get_db, DialogueSession
+from app.database import get_db, AsyncSessionLocal, DialogueCorrection, DialogueSession, PracticeEvent
 from app.models import DialogueRequest, DialogueResponse, CorrectionRequest, CorrectionResponse
+from app.services.dialogue_context import EMPTY_CONTEXT, build_context, refresh_summary
+from app.services.dialogue_store import append_messages, delete_messages, page_messages
 from app.services.openai_service import openai_service
+from app.services.study_stats import record_daily_activity, record_session_change
+from app.utils.cursor import encode_cursor, decode_cursor
 
 router = APIRouter()
 
+DIALOGUE_REPLY_TIMEOUT = float(os.getenv("DIALOGUE_REPLY_TIMEOUT", "30"))
+DIALOGUE_CORRECTION_TIMEOUT = float(os.getenv("DIALOGUE_CORRECTION_TIMEOUT", "5"))
+# How long a late correction stays fetchable after it finishes
+CORRECTION_RESULT_TTL = float(os.getenv("CORRECTION_RESULT_TTL", "300"))
+# How often a poll answered by another worker rechecks the correction's row
+CORRECTION_POLL_INTERVAL = 0.5
+
+FALLBACK_REPLY = "すみません、もう一度お願いします。"
+
+# Late corrections this worker is still running, keyed by correction id. Each
+# one also has a dialogue_corrections row, which is how other workers answer polls.
+pending_corrections: Dict[str, Tuple[asyncio.Task, str]] = {}
+
+# Keeps fire-and-forget tasks referenced until they finish
+_background_tasks = set()
+
 SCENARIOS = {
     "greeting": "打招呼",
     "interview": "面试",
@@ -33,6 +57,7 @@ async def send_message(
     db: AsyncSession = Depends(get_db)
 ):
     session_id = request.sessionId
+    is_new_session = not session_id
     
     if not session_id:
         session_id = str(uuid.uuid4())
@@ -40,40 +65,255 @@ async def send_message(
             id=session_id,
             user_id=user_id,
             scenario=request.scenarioId,
-            history=[]
+            message_count=0,
+            created_at=datetime.utcnow()
         )
         db.add(session)
+        context = EMPTY_CONTEXT
     else:
-        result = await db.execute(select(DialogueSession).where(DialogueSession.id == session_id))
-        session = result.scalar_one_or_none()
+        session = await db.get(DialogueSession, session_id)
         
         if not session:
             raise HTTPException(status_code=404, detail="Session not found")
-    
-    history = session.history or []
-    history.append({"role": "user", "text": request.message})
+        context = await build_context(db, session)
+        # Don't hold the read transaction across the LLM call
+        await db.commit()
     
     scenario_name = SCENARIOS.get(request.scenarioId, "日常会话")
-    ai_response = await openai_service.generate_dialogue_response(
+    loop = asyncio.get_running_loop()
+    correction_deadline = loop.time() + DIALOGUE_CORRECTION_TIMEOUT
+    
+    reply_task = asyncio.create_task(openai_service.generate_dialogue_response(
         scenario_name,
         request.message,
-        history
-    )
+        context.history,
+        context.summary
+    ))
+    correction_task = asyncio.create_task(openai_service.correct_japanese(request.message))
     
-    history.append({"role": "assistant", "text": ai_response["reply"]})
-    session.history = history
-    session.updated_at = datetime.utcnow()
+    try:
+        ai_response = await asyncio.wait_for(reply_task, DIALOGUE_REPLY_TIMEOUT)
+    except asyncio.TimeoutError:
+        ai_response = {"reply": FALLBACK_REPLY}
     
-    correction = await openai_service.correct_japanese(request.message)
+    # Wait for the correction before writing: once the turn is written the
+    # transaction holds SQLite's write lock until commit
+    await asyncio.wait({correction_task}, timeout=max(0.0, correction_deadline - loop.time()))
     
+    await append_messages(db, session_id, [("user", request.message), ("assistant", ai_response["reply"])])
+    db.add(PracticeEvent(user_id=user_id, kind="dialogue", session_id=session_id))
+    if is_new_session:
+        await record_session_change(db, user_id, session.created_at, 1)
+    await record_daily_activity(db, user_id, dialogue=1)
     await db.commit()
     
+    if context.needs_summary:
+        _spawn(refresh_summary(session_id, scenario_name))
+    
+    if correction_task.done():
+        return DialogueResponse(
+            reply=ai_response["reply"],
+            sessionId=session_id,
+            correction=_visible_correction(correction_task.result(), request.message)
+        )
+    
+    correction_id = await _defer_correction(correction_task, request.message)
     return DialogueResponse(
         reply=ai_response["reply"],
         sessionId=session_id,
-        correction=correction if correction["corrected"] != request.message else None
+        correctionPending=True,
+        correctionId=correction_id
     )
 
+@router.post("/dialogue/stream")
+async def stream_message(
+    request: DialogueRequest,
+    user_id: str = "default_user",
+    db: AsyncSession = Depends(get_db)
+):
+    session_id = request.sessionId
+    
+    if not session_id:
+        session_id = str(uuid.uuid4())
+        session = DialogueSession(
+            id=session_id,
+            user_id=user_id,
+            scenario=request.scenarioId,
+            message_count=0,
+            created_at=datetime.utcnow()
+        )
+        db.add(session)
+        # Counted now: a client that leaves before the first token still
+        # leaves the session behind
+        await record_session_change(db, user_id, session.created_at, 1)
+        await db.commit()
+        context = EMPTY_CONTEXT
+    else:
+        session = await db.get(DialogueSession, session_id)
+        
+        if not session:
+            raise HTTPException(status_code=404, detail="Session not found")
+        context = await build_context(db, session)
+        # The turn is written by _append_turn on its own session; release this
+        # connection rather than holding it for the whole stream
+        await db.commit()
+    
+    scenario_name = SCENARIOS.get(request.scenarioId, "日常会话")
+    
+    async def event_stream():
+        loop = asyncio.get_running_loop()
+        correction_deadline = loop.time() + DIALOGUE_CORRECTION_TIMEOUT
+        correction_task = asyncio.create_task(openai_service.correct_japanese(request.message))
+        parts = []
+        persisted = False
+        deferred = False
+        
+        try:
+            yield _sse("session", {"sessionId": session_id})
+            
+            async for token in openai_service.stream_dialogue_response(scenario_name, request.message, context.history, context.summary):
+                parts.append(token)
+                yield _sse("token", {"text": token})
+            
+            reply = "".join(parts) or FALLBACK_REPLY
+            await _append_turn(session_id, request.message, reply)
+            persisted = True
+            if context.needs_summary:
+                _spawn(refresh_summary(session_id, scenario_name))
+            yield _sse("reply", {"reply": reply, "sessionId": session_id})
+            
+            await asyncio.wait({correction_task}, timeout=max(0.0, correction_deadline - loop.time()))
+            if correction_task.done():
+                yield _sse("correction", {
+                    "correction": _visible_correction(correction_task.result(), request.message),
+                    "correctionPending": False
+                })
+            else:
+                correction_id = await _defer_correction(correction_task, request.message)
+                deferred = True
+                yield _sse("correction", {
+                    "correction": None,
+                    "correctionPending": True,
+                    "correctionId": correction_id
+                })
+        finally:
+            if not deferred:
+                correction_task.cancel()
+            if not persisted and parts:
+                # The client went away mid-stream; keep what was generated
+                _spawn(_append_turn(session_id, request.message, "".join(parts)))
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.get("/dialogue/correction/{correction_id}")
+async def get_pending_correction(
+    correction_id: str,
+    wait: float = Query(default=0, ge=0, le=30)
+):
+    pending = pending_corrections.get(correction_id)
+    
+    if pending:
+        task, message = pending
+        if not task.done() and wait > 0:
+            await asyncio.wait({task}, timeout=wait)
+        
+        if not task.done():
+            return {"status": "pending", "correction": None}
+        
+        return {
+            "status": "done",
+            "correction": _visible_correction(task.result(), message)
+        }
+    
+    # Running on another worker (or already stored): read its row until it
+    # finishes or the wait runs out
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + wait
+    while True:
+        async with AsyncSessionLocal() as db:
+            row = await db.get(DialogueCorrection, correction_id)
+        
+        if not row or _correction_expired(row):
+            raise HTTPException(status_code=404, detail="Correction not found")
+        
+        if row.finished_at:
+            return {
+                "status": "done",
+                "correction": _visible_correction(row.correction, row.message)
+            }
+        
+        if loop.time() >= deadline:
+            return {"status": "pending", "correction": None}
+        await asyncio.sleep(min(CORRECTION_POLL_INTERVAL, deadline - loop.time()))
+
+def _visible_correction(correction: Dict, message: str) -> Optional[Dict]:
+    return correction if correction["corrected"] != message else None
+
+def _sse(event: str, data: Dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def _spawn(coro):
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+async def _append_turn(session_id: str, user_text: str, reply: str):
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(select(DialogueSession.user_id).where(DialogueSession.id == session_id))
+        user_id = result.scalar_one_or_none()
+        
+        if user_id is None:
+            return
+        await db.commit()
+        
+        await append_messages(db, session_id, [("user", user_text), ("assistant", reply)])
+        db.add(PracticeEvent(user_id=user_id, kind="dialogue", session_id=session_id))
+        await record_daily_activity(db, user_id, dialogue=1)
+        await db.commit()
+
+async def _defer_correction(task: asyncio.Task, message: str) -> str:
+    correction_id = str(uuid.uuid4())
+    async with AsyncSessionLocal() as db:
+        cutoff = datetime.utcnow() - timedelta(seconds=CORRECTION_RESULT_TTL)
+        await db.execute(delete(DialogueCorrection).where(
+            DialogueCorrection.created_at < cutoff,
+            or_(DialogueCorrection.finished_at.is_(None), DialogueCorrection.finished_at < cutoff)
+        ))
+        db.add(DialogueCorrection(id=correction_id, message=message))
+        await db.commit()
+    pending_corrections[correction_id] = (task, message)
+    
+    def store(_):
+        if task.cancelled() or task.exception():
+            pending_corrections.pop(correction_id, None)
+        else:
+            _spawn(_store_correction(correction_id, task.result()))
+    
+    task.add_done_callback(store)
+    return correction_id
+
+async def _store_correction(correction_id: str, correction: Dict):
+    try:
+        async with AsyncSessionLocal() as db:
+            row = await db.get(DialogueCorrection, correction_id)
+            if row:
+                row.correction = correction
+                row.finished_at = datetime.utcnow()
+            await db.commit()
+    except Exception as e:
+        print(f"Error storing correction {correction_id}: {e}")
+    finally:
+        # Polls on this worker read the task until the row has the result
+        pending_corrections.pop(correction_id, None)
+
+def _correction_expired(row: DialogueCorrection) -> bool:
+    cutoff = datetime.utcnow() - timedelta(seconds=CORRECTION_RESULT_TTL)
+    return row.created_at < cutoff and (row.finished_at is None or row.finished_at < cutoff)
+
 @router.post("/dialogue/correct", response_model=CorrectionResponse)
 async def correct_message(request: CorrectionRequest):
     result = await openai_service.correct_japanese(request.message)
@@ -87,18 +327,34 @@ async def correct_message(request: CorrectionRequest):
 @router.get("/dialogue/history/{session_id}")
 async def get_dialogue_history(
     session_id: str,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=500),
+    cursor: Optional[str] = Query(None),
     db: AsyncSession = Depends(get_db)
 ):
-    result = await db.execute(select(DialogueSession).where(DialogueSession.id == session_id))
-    session = result.scalar_one_or_none()
+    session = await db.get(DialogueSession, session_id)
     
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
     
+    after_seq = 0
+    if cursor:
+        (after,) = decode_cursor(cursor, size=1)
+        try:
+            after_seq = int(after)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    
+    messages = await page_messages(db, session_id, after_seq, limit + 1 if limit else None)
+    if limit and len(messages) > limit:
+        messages = messages[:limit]
+        response.headers["X-Next-Cursor"] = encode_cursor(messages[-1].seq)
+    
     return {
         "sessionId": session.id,
         "scenario": session.scenario,
-        "history": session.history,
+        "messageCount": session.message_count or 0,
+        "history": [{"role": m.role, "text": m.text} for m in messages],
         "created_at": session.created_at,
         "updated_at": session.updated_at
     }
@@ -114,7 +370,9 @@ async def delete_session(
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
     
+    await delete_messages(db, session_id)
     await db.delete(session)
+    await record_session_change(db, session.user_id, session.created_at, -1)
     await db.commit()
     
     return {"message": "Session deleted successfully"}
\ No newline at end of file
@@ -1,62 +1,75 @@
-from fastapi import APIRouter, Depends, Query, HTTPException
+from fastapi import APIRouter, Depends, Query, HTTPException, Response
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, and_, func
-from typing import List, Optional
-import uuid
-from datetime import datetime
+from sqlalchemy import select, update, and_, or_, func
+from typing import Dict, List, Optional, Tuple
+from datetime import date, datetime
 
-from app.database import get_db, Grammar, Exercise, Mistake, UserProficiency
+from app.database import get_db, dialect_insert, Grammar, Exercise, Mistake, PracticeEvent, UserProficiency
 from app.models import (
-    GrammarItem, GrammarExerciseRequest, SubmitAnswerRequest,
+    GrammarItem, GrammarExerciseRequest, SubmitAnswerRequest, BatchSubmitRequest,
     ExerciseQuestion, ExerciseResult, MistakeDetail, ProficiencyScore
 )
 from app.services.openai_service import openai_service
-from app.utils.grammar_data import get_initial_grammar_data
+from app.services.grammar_catalog import grammar_catalog, GrammarRecord
+from app.services.exercise_pool import exercise_pool
+from app.services.grading import grade_locally
+from app.services.review_schedule import ReviewState, schedule
+from app.services.study_stats import record_daily_activity
+from app.utils.cursor import encode_cursor, decode_cursor
+from app.utils.dates import parse_zone, local_range_utc
 
 router = APIRouter()
 
+# Proficiency score at which a grammar point counts as mastered
+MASTERED_SCORE = 80
+
 @router.get("/grammar/list", response_model=List[GrammarItem])
 async def list_grammar(
+    response: Response,
     level: Optional[str] = Query(None),
     theme: Optional[str] = Query(None),
     user_id: str = Query(default="default_user"),
+    limit: Optional[int] = Query(None, ge=1, le=500),
+    cursor: Optional[str] = Query(None),
     db: AsyncSession = Depends(get_db)
 ):
-    query = select(Grammar)
+    records = grammar_catalog.filter(level, theme)
     
-    if level:
-        query = query.where(Grammar.level == level)
+    if cursor:
+        cursor_level, cursor_id = decode_cursor(cursor)
+        records = grammar_catalog.page_after(records, cursor_level, cursor_id)
     
-    result = await db.execute(query)
-    grammars = result.scalars().all()
+    if limit and len(records) > limit:
+        records = records[:limit]
+        response.headers["X-Next-Cursor"] = encode_cursor(records[-1].level, records[-1].id)
     
-    if theme:
-        grammars = [g for g in grammars if theme in (g.themes or [])]
+    if not records:
+        return []
     
-    grammar_items = []
-    for g in grammars:
-        prof_query = select(UserProficiency).where(
-            and_(
-                UserProficiency.user_id == user_id,
-                UserProficiency.grammar_id == g.id
-            )
-        )
-        prof_result = await db.execute(prof_query)
-        proficiency = prof_result.scalar_one_or_none()
-        
-        item = GrammarItem(
-            id=g.id,
-            level=g.level,
-            title=g.title,
-            structure=g.structure,
-            usage=g.usage,
-            examples=g.examples or [],
-            themes=g.themes or [],
-            proficiency=proficiency.proficiency_score if proficiency else 0.0
-        )
-        grammar_items.append(item)
+    prof_query = select(
+        UserProficiency.grammar_id,
+        func.max(UserProficiency.proficiency_score)
+    ).where(UserProficiency.user_id == user_id).group_by(UserProficiency.grammar_id)
+    
+    if len(records) < len(grammar_catalog):
+        prof_query = prof_query.where(UserProficiency.grammar_id.in_([r.id for r in records]))
     
-    return grammar_items
+    prof_result = await db.execute(prof_query)
+    scores = dict(prof_result.all())
+    
+    return [_grammar_item(r, scores.get(r.id)) for r in records]
+
+def _grammar_item(record: GrammarRecord, score: Optional[float]) -> GrammarItem:
+    return GrammarItem(
+        id=record.id,
+        level=record.level,
+        title=record.title,
+        structure=record.structure,
+        usage=record.usage,
+        examples=[dict(e) for e in record.examples],
+        themes=list(record.themes),
+        proficiency=score or 0.0
+    )
 
 @router.get("/grammar/{grammar_id}", response_model=GrammarItem)
 async def get_grammar_detail(
@@ -64,8 +77,7 @@ async def get_grammar_detail(
     user_id: str = Query(default="default_user"),
     db: AsyncSession = Depends(get_db)
 ):
-    result = await db.execute(select(Grammar).where(Grammar.id == grammar_id))
-    grammar = result.scalar_one_or_none()
+    grammar = grammar_catalog.get(grammar_id)
     
     if not grammar:
         raise HTTPException(status_code=404, detail="Grammar not found")
@@ -79,55 +91,31 @@ async def get_grammar_detail(
     prof_result = await db.execute(prof_query)
     proficiency = prof_result.scalar_one_or_none()
     
-    return GrammarItem(
-        id=grammar.id,
-        level=grammar.level,
-        title=grammar.title,
-        structure=grammar.structure,
-        usage=grammar.usage,
-        examples=grammar.examples or [],
-        themes=grammar.themes or [],
-        proficiency=proficiency.proficiency_score if proficiency else 0.0
-    )
+    return _grammar_item(grammar, proficiency.proficiency_score if proficiency else None)
 
 @router.post("/exercise/generate", response_model=List[ExerciseQuestion])
 async def generate_exercise(
     req: GrammarExerciseRequest,
     db: AsyncSession = Depends(get_db)
 ):
-    result = await db.execute(select(Grammar).where(Grammar.id == req.grammarId))
-    grammar = result.scalar_one_or_none()
+    grammar = grammar_catalog.get(req.grammarId)
     
     if not grammar:
         raise HTTPException(status_code=404, detail="Grammar not found")
     
-    exercise_data = await openai_service.generate_exercise(grammar.title, req.type)
+    exercises = await exercise_pool.take(db, grammar, req.type)
     
-    questions = []
-    for q in exercise_data.get("questions", []):
-        question_id = str(uuid.uuid4())
-        
-        exercise = Exercise(
-            grammar_id=req.grammarId,
-            type=req.type,
-            question=q["question"],
-            options=q.get("options"),
-            correct_answer=q["correct_answer"],
-            explanation=q["explanation"]
+    return [
+        ExerciseQuestion(
+            id=str(e.id),
+            type=e.type,
+            question=e.question,
+            options=e.options,
+            correct_answer=e.correct_answer,
+            explanation=e.explanation or ""
         )
-        db.add(exercise)
-        
-        questions.append(ExerciseQuestion(
-            id=question_id,
-            type=req.type,
-            question=q["question"],
-            options=q.get("options"),
-            correct_answer=q["correct_answer"],
-            explanation=q["explanation"]
-        ))
-    
-    await db.commit()
-    return questions
+        for e in exercises
+    ]
 
 @router.post("/exercise/submit", response_model=ExerciseResult)
 async def submit_answer(
@@ -135,89 +123,290 @@ async def submit_answer(
     user_id: str = Query(default="default_user"),
     db: AsyncSession = Depends(get_db)
 ):
-    result = await db.execute(select(Grammar).where(Grammar.id == req.grammarId))
-    grammar = result.scalar_one_or_none()
+    grammar = grammar_catalog.get(req.grammarId)
     
     if not grammar:
         raise HTTPException(status_code=404, detail="Grammar not found")
     
-    check_result = await openai_service.check_answer(
-        grammar.title,
-        req.userAnswer,
-        req.userAnswer
-    )
-    
-    prof_query = select(UserProficiency).where(
-        and_(
-            UserProficiency.user_id == user_id,
-            UserProficiency.grammar_id == req.grammarId
-        )
-    )
-    prof_result = await db.execute(prof_query)
-    proficiency = prof_result.scalar_one_or_none()
+    exercise = await _get_exercise(db, req.questionId, req.grammarId)
+    # End the read transaction before grading and writing: it shouldn't pin a
+    # pooled connection across an LLM call, and a SQLite WAL reader can't be
+    # upgraded to a writer once another request has committed in between
+    await db.commit()
     
-    if not proficiency:
-        proficiency = UserProficiency(
-            user_id=user_id,
-            grammar_id=req.grammarId,
-            practice_count=0,
-            correct_count=0,
-            proficiency_score=0.0
+    check_result = grade_locally(exercise, req.userAnswer)
+    if check_result is None:
+        check_result = await openai_service.check_answer(
+            grammar.title,
+            req.userAnswer,
+            exercise.correct_answer
         )
-        db.add(proficiency)
     
-    proficiency.practice_count += 1
-    if check_result["result"] == "correct":
-        proficiency.correct_count += 1
-    else:
+    is_correct = check_result["result"] == "correct"
+    practice_count, was_mastered, is_mastered = await _record_practice(db, user_id, req.grammarId, [is_correct])
+    await record_daily_activity(
+        db,
+        user_id,
+        grammar=1,
+        mistakes=0 if is_correct else 1,
+        mastered=int(is_mastered) - int(was_mastered),
+        new_grammar=1 if practice_count == 1 else 0
+    )
+    db.add(PracticeEvent(
+        user_id=user_id,
+        kind="grammar",
+        grammar_id=req.grammarId,
+        correct=is_correct
+    ))
+    
+    if not is_correct:
         mistake = Mistake(
             user_id=user_id,
             grammar_id=req.grammarId,
             question_id=req.questionId,
             user_answer=req.userAnswer,
-            correct_answer=check_result.get("suggestion", "")
+            correct_answer=check_result.get("correct_answer", exercise.correct_answer)
         )
         db.add(mistake)
     
-    proficiency.proficiency_score = (proficiency.correct_count / proficiency.practice_count) * 100
-    proficiency.last_practiced = datetime.utcnow()
-    
     await db.commit()
     
     return ExerciseResult(
         result=check_result["result"],
         explanation=check_result["explanation"],
-        correct_answer=check_result.get("suggestion", ""),
+        correct_answer=check_result.get("correct_answer", exercise.correct_answer),
         suggestion=check_result.get("suggestion")
     )
 
+@router.post("/exercise/submit/batch", response_model=List[ExerciseResult])
+async def submit_answers(
+    req: BatchSubmitRequest,
+    user_id: str = Query(default="default_user"),
+    db: AsyncSession = Depends(get_db)
+):
+    # A whole practice set in one request: one exercise query, one grading
+    # call for the answers that need the LLM, one proficiency upsert per
+    # grammar point and a single commit. Results come back in request order.
+    for answer in req.answers:
+        if not grammar_catalog.get(answer.grammarId):
+            raise HTTPException(status_code=404, detail="Grammar not found")
+    
+    exercise_ids = [_exercise_id(a.questionId) for a in req.answers]
+    result = await db.execute(select(Exercise).where(Exercise.id.in_(set(exercise_ids) - {None})))
+    found = {e.id: e for e in result.scalars().all()}
+    # The exercise behind each answer, in request order
+    exercises = [found.get(exercise_id) for exercise_id in exercise_ids]
+    for answer, exercise in zip(req.answers, exercises):
+        if not exercise or exercise.grammar_id != answer.grammarId:
+            raise HTTPException(status_code=404, detail="Exercise not found")
+    # Same as single submits: no read transaction held across grading
+    await db.commit()
+    
+    results = [grade_locally(e, a.userAnswer) for a, e in zip(req.answers, exercises)]
+    pending = [i for i, r in enumerate(results) if r is None]
+    if pending:
+        checked = await openai_service.check_answers([
+            (
+                grammar_catalog.get(req.answers[i].grammarId).title,
+                req.answers[i].userAnswer,
+                exercises[i].correct_answer
+            )
+            for i in pending
+        ])
+        for i, check_result in zip(pending, checked):
+            results[i] = check_result
+    
+    outcomes: Dict[str, List[bool]] = {}
+    for answer, check_result in zip(req.answers, results):
+        outcomes.setdefault(answer.grammarId, []).append(check_result["result"] == "correct")
+    
+    mastered = new_grammar = 0
+    # Sorted so concurrent batches take row locks in the same order
+    for grammar_id in sorted(outcomes):
+        practice_count, was_mastered, is_mastered = await _record_practice(db, user_id, grammar_id, outcomes[grammar_id])
+        mastered += int(is_mastered) - int(was_mastered)
+        new_grammar += int(practice_count == len(outcomes[grammar_id]))
+    
+    correct_answers = [
+        r.get("correct_answer", e.correct_answer)
+        for e, r in zip(exercises, results)
+    ]
+    mistakes = []
+    for answer, check_result, correct_answer in zip(req.answers, results, correct_answers):
+        is_correct = check_result["result"] == "correct"
+        db.add(PracticeEvent(
+            user_id=user_id,
+            kind="grammar",
+            grammar_id=answer.grammarId,
+            correct=is_correct
+        ))
+        if not is_correct:
+            mistakes.append(Mistake(
+                user_id=user_id,
+                grammar_id=answer.grammarId,
+                question_id=answer.questionId,
+                user_answer=answer.userAnswer,
+                correct_answer=correct_answer
+            ))
+    db.add_all(mistakes)
+    
+    await record_daily_activity(
+        db,
+        user_id,
+        grammar=len(req.answers),
+        mistakes=len(mistakes),
+        mastered=mastered,
+        new_grammar=new_grammar
+    )
+    await db.commit()
+    
+    return [
+        ExerciseResult(
+            result=r["result"],
+            explanation=r["explanation"],
+            correct_answer=correct_answer,
+            suggestion=r.get("suggestion")
+        )
+        for r, correct_answer in zip(results, correct_answers)
+    ]
+
+async def _record_practice(db: AsyncSession, user_id: str, grammar_id: str, outcomes: List[bool]) -> Tuple[int, bool, bool]:
+    # Single atomic upsert, so concurrent submits can't race on the read-modify-write.
+    # The review schedule is advanced right after, while this transaction holds
+    # the row; all answers to the point in this submit make one review, missed
+    # if any of them was wrong. Returns the new practice count and whether the point was
+    # mastered before/after.
+    attempts, correct = len(outcomes), sum(outcomes)
+    now = datetime.utcnow()
+    
+    stmt = dialect_insert(UserProficiency).values(
+        user_id=user_id,
+        grammar_id=grammar_id,
+        practice_count=attempts,
+        correct_count=correct,
+        proficiency_score=correct * 100.0 / attempts,
+        last_practiced=now
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[UserProficiency.user_id, UserProficiency.grammar_id],
+        set_={
+            "practice_count": UserProficiency.practice_count + attempts,
+            "correct_count": UserProficiency.correct_count + correct,
+            "proficiency_score": (UserProficiency.correct_count + correct) * 100.0 / (UserProficiency.practice_count + attempts),
+            "last_practiced": now
+        }
+    ).returning(
+        UserProficiency.id,
+        UserProficiency.practice_count,
+        UserProficiency.correct_count,
+        UserProficiency.proficiency_score,
+        UserProficiency.ease,
+        UserProficiency.interval_days,
+        UserProficiency.repetitions,
+        UserProficiency.due_at
+    )
+    result = await db.execute(stmt)
+    row_id, practice_count, correct_count, score, ease, interval_days, repetitions, due_at = result.one()
+    
+    review = schedule(ReviewState(ease, interval_days, repetitions, due_at), all(outcomes), now)
+    await db.execute(
+        update(UserProficiency)
+        .where(UserProficiency.id == row_id)
+        .values(**review._asdict())
+        .execution_options(synchronize_session=False)
+    )
+    
+    previous_count = practice_count - attempts
+    previous_score = (correct_count - correct) * 100.0 / previous_count if previous_count else 0.0
+    was_mastered = previous_count > 0 and previous_score >= MASTERED_SCORE
+    return practice_count, was_mastered, score >= MASTERED_SCORE
+
+def _exercise_id(question_id: str) -> Optional[int]:
+    # isdigit() alone also accepts characters like "²" that int() rejects
+    if question_id.isascii() and question_id.isdecimal():
+        return int(question_id)
+    return None
+
+async def _get_exercise(db: AsyncSession, question_id: str, grammar_id: str) -> Exercise:
+    exercise = None
+    exercise_id = _exercise_id(question_id)
+    if exercise_id is not None:
+        result = await db.execute(select(Exercise).where(Exercise.id == exercise_id))
+        exercise = result.scalar_one_or_none()
+    
+    if not exercise or exercise.grammar_id != grammar_id:
+        raise HTTPException(status_code=404, detail="Exercise not found")
+    return exercise
+
 @router.get("/mistakes", response_model=List[MistakeDetail])
 async def get_mistake_list(
+    response: Response,
     user_id: str = Query(default="default_user"),
+    grammar_id: Optional[str] = Query(None),
+    level: Optional[str] = Query(None),
+    start: Optional[date] = Query(None),
+    end: Optional[date] = Query(None),
+    tz: str = Query(default="UTC"),
+    limit: Optional[int] = Query(None, ge=1, le=500),
+    cursor: Optional[str] = Query(None),
     db: AsyncSession = Depends(get_db)
 ):
-    result = await db.execute(
-        select(Mistake).where(Mistake.user_id == user_id).order_by(Mistake.timestamp.desc())
-    )
-    mistakes = result.scalars().all()
-    
-    mistake_details = []
-    for m in mistakes:
-        grammar_result = await db.execute(select(Grammar).where(Grammar.id == m.grammar_id))
-        grammar = grammar_result.scalar_one_or_none()
-        
-        detail = MistakeDetail(
+    # Newest first, keyed on (timestamp, id) so pages stay stable while new
+    # mistakes are recorded. Titles come from the same query via the join.
+    query = select(Mistake, Grammar.title).outerjoin(
+        Grammar, Grammar.id == Mistake.grammar_id
+    ).where(Mistake.user_id == user_id)
+    
+    if grammar_id:
+        query = query.where(Mistake.grammar_id == grammar_id)
+    if level:
+        query = query.where(Grammar.level == level)
+    if start and end and end < start:
+        raise HTTPException(status_code=400, detail="end must not be before start")
+    if start or end:
+        start_utc, end_utc = local_range_utc(start, end, parse_zone(tz))
+        if start_utc:
+            query = query.where(Mistake.timestamp >= start_utc)
+        if end_utc:
+            query = query.where(Mistake.timestamp < end_utc)
+    
+    if cursor:
+        cursor_timestamp, cursor_id = decode_cursor(cursor)
+        try:
+            cursor_timestamp, cursor_id = datetime.fromisoformat(cursor_timestamp), int(cursor_id)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        query = query.where(
+            or_(
+                Mistake.timestamp < cursor_timestamp,
+                and_(Mistake.timestamp == cursor_timestamp, Mistake.id < cursor_id)
+            )
+        )
+    
+    query = query.order_by(Mistake.timestamp.desc(), Mistake.id.desc())
+    if limit:
+        query = query.limit(limit + 1)
+    
+    result = await db.execute(query)
+    rows = result.all()
+    
+    if limit and len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1][0]
+        response.headers["X-Next-Cursor"] = encode_cursor(last.timestamp.isoformat(), last.id)
+    
+    return [
+        MistakeDetail(
             id=m.id,
             grammarId=m.grammar_id,
             questionId=m.question_id,
             user_answer=m.user_answer,
             correct_answer=m.correct_answer,
-            explanation=f"Grammar: {grammar.title if grammar else 'Unknown'}",
+            explanation=f"Grammar: {title or 'Unknown'}",
             timestamp=m.timestamp
         )
-        mistake_details.append(detail)
-    
-    return mistake_details
+        for m, title in rows
+    ]
 
 @router.get("/mistakes/detail")
 async def get_mistake_detail(
@@ -230,8 +419,7 @@ async def get_mistake_detail(
     if not mistake:
         raise HTTPException(status_code=404, detail="Mistake not found")
     
-    grammar_result = await db.execute(select(Grammar).where(Grammar.id == mistake.grammar_id))
-    grammar = grammar_result.scalar_one_or_none()
+    grammar = grammar_catalog.get(mistake.grammar_id)
     
     return MistakeDetail(
         id=mistake.id,
@@ -281,51 +469,17 @@ async def get_recommendations(
     user_id: str = Query(default="default_user"),
     db: AsyncSession = Depends(get_db)
 ):
-    query = select(UserProficiency).where(
-        and_(
-            UserProficiency.user_id == user_id,
-            UserProficiency.proficiency_score < 60
-        )
-    ).order_by(UserProficiency.proficiency_score).limit(5)
-    
-    result = await db.execute(query)
-    low_proficiency = result.scalars().all()
-    
-    recommendations = [prof.grammar_id for prof in low_proficiency]
-    
-    if len(recommendations) < 5:
-        mistakes_query = select(Mistake.grammar_id, func.count(Mistake.id).label('count')).where(
-            Mistake.user_id == user_id
-        ).group_by(Mistake.grammar_id).order_by(func.count(Mistake.id).desc()).limit(5)
-        
-        mistakes_result = await db.execute(mistakes_query)
-        frequent_mistakes = mistakes_result.all()
-        
-        for grammar_id, _ in frequent_mistakes:
-            if grammar_id not in recommendations:
-                recommendations.append(grammar_id)
-                if len(recommendations) >= 5:
-                    break
-    
-    return recommendations[:5]
+    # Review queue: most overdue first, then whatever comes due soonest.
+    # One range scan on (user_id, due_at).
+    result = await db.execute(
+        select(UserProficiency.grammar_id)
+        .where(UserProficiency.user_id == user_id)
+        .order_by(UserProficiency.due_at)
+        .limit(5)
+    )
+    return list(result.scalars().all())
 
-@router.on_event("startup")
-async def initialize_grammar_data():
-    from app.database import AsyncSessionLocal, DB_PATH, engine, Base
-    # Ensure the database directory exists
-    DB_PATH.parent.mkdir(parents=True, exist_ok=True)
-    
-    # Create tables if they don't exist
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
-    
-    async with AsyncSessionLocal() as db:
-        result = await db.execute(select(func.count(Grammar.id)))
-        count = result.scalar()
-        
-        if count == 0:
-            grammar_data = get_initial_grammar_data()
-            for g in grammar_data:
-                grammar = Grammar(**g)
-                db.add(grammar)
-            await db.commit()
\ No newline at end of file
+@router.post("/grammar/catalog/reload")
+async def reload_grammar_catalog():
+    await grammar_catalog.reload()
+    return {"count": len(grammar_catalog), "loaded_at": grammar_catalog.loaded_at}
\ No newline at end of file
@@ -1,166 +1,205 @@
-from fastapi import APIRouter, Depends, Query
+from fastapi import APIRouter, Depends, Query, HTTPException
 from fastapi.responses import FileResponse
+from starlette.background import BackgroundTask
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, and_, func
-from datetime import datetime, timedelta
-import pandas as pd
+from sqlalchemy import select, and_, func, case
+from datetime import date, datetime, timedelta
+from zoneinfo import ZoneInfo
 import os
-from typing import List, Dict
+from typing import List, Dict, Tuple
 
-from app.database import get_db, StudyStats, UserProficiency, Mistake, DialogueSession
+from app.database import get_db, shifted_date, StudyStats, PracticeEvent
 from app.models import WeeklyStats
+from app.services.cache import TTLCache, on_user_data_changed
+from app.services.export import XLSX_MEDIA_TYPE, new_export_path, remove_file, write_study_workbook
+from app.services.export_jobs import export_jobs
+from app.utils.dates import parse_zone, date_range, local_range_utc, offset_segments
 
 router = APIRouter()
 
+# Longest range /stats/range will return, to keep the response a sane size
+MAX_RANGE_DAYS = 3660
+# The frontend polls the summary on every page; writes invalidate it, the TTL
+# only bounds staleness across workers
+STATS_SUMMARY_TTL_SECONDS = float(os.getenv("STATS_SUMMARY_TTL_SECONDS", "30"))
+
+summary_cache = TTLCache(STATS_SUMMARY_TTL_SECONDS)
+on_user_data_changed(summary_cache.invalidate)
+
 @router.get("/stats/weekly", response_model=WeeklyStats)
 async def get_weekly_stats(
     user_id: str = Query(default="default_user"),
+    tz: str = Query(default="UTC"),
+    db: AsyncSession = Depends(get_db)
+):
+    zone = parse_zone(tz)
+    today = datetime.now(zone).date()
+    return await _range_stats(db, user_id, today - timedelta(days=6), today, zone)
+
+@router.get("/stats/monthly", response_model=WeeklyStats)
+async def get_monthly_stats(
+    user_id: str = Query(default="default_user"),
+    tz: str = Query(default="UTC"),
+    db: AsyncSession = Depends(get_db)
+):
+    zone = parse_zone(tz)
+    today = datetime.now(zone).date()
+    return await _range_stats(db, user_id, today - timedelta(days=29), today, zone)
+
+@router.get("/stats/range", response_model=WeeklyStats)
+async def get_range_stats(
+    start: date,
+    end: date,
+    user_id: str = Query(default="default_user"),
+    tz: str = Query(default="UTC"),
     db: AsyncSession = Depends(get_db)
 ):
-    end_date = datetime.utcnow()
-    start_date = end_date - timedelta(days=7)
+    if end < start:
+        raise HTTPException(status_code=400, detail="end must not be before start")
+    if (end - start).days >= MAX_RANGE_DAYS:
+        raise HTTPException(status_code=400, detail=f"Range is limited to {MAX_RANGE_DAYS} days")
     
-    daily_stats = []
-    total_grammar = 0
-    total_dialogue = 0
+    return await _range_stats(db, user_id, start, end, parse_zone(tz))
+
+def _local_date(column, segments: List[Tuple[datetime, int]]):
+    # Calendar date of a UTC timestamp in the user's timezone; one CASE arm per DST run
+    if len(segments) == 1:
+        return shifted_date(column, segments[0][1])
     
-    for i in range(7):
-        current_date = start_date + timedelta(days=i)
-        next_date = current_date + timedelta(days=1)
-        
-        grammar_query = select(func.count(UserProficiency.id)).where(
-            and_(
-                UserProficiency.user_id == user_id,
-                UserProficiency.last_practiced >= current_date,
-                UserProficiency.last_practiced < next_date
-            )
-        )
-        grammar_result = await db.execute(grammar_query)
-        grammar_count = grammar_result.scalar() or 0
-        
-        dialogue_query = select(func.count(DialogueSession.id)).where(
-            and_(
-                DialogueSession.user_id == user_id,
-                DialogueSession.updated_at >= current_date,
-                DialogueSession.updated_at < next_date
-            )
-        )
-        dialogue_result = await db.execute(dialogue_query)
-        dialogue_count = dialogue_result.scalar() or 0
-        
+    return case(
+        *[(column >= since, shifted_date(column, offset)) for since, offset in reversed(segments[1:])],
+        else_=shifted_date(column, segments[0][1])
+    )
+
+async def _range_stats(db: AsyncSession, user_id: str, start: date, end: date, zone: ZoneInfo) -> WeeklyStats:
+    start_utc, end_utc = local_range_utc(start, end, zone)
+    segments = offset_segments(start_utc, end_utc, zone)
+    
+    # Rollups are kept per UTC day; other timezones regroup the raw event log
+    if all(offset == 0 for _, offset in segments):
+        counts = await _rollup_counts(db, user_id, start_utc, end_utc)
+    else:
+        counts = await _event_counts(db, user_id, start_utc, end_utc, segments)
+    
+    daily_stats = []
+    for d in date_range(start, end):
+        grammar_count, dialogue_count = counts.get(d.isoformat(), (0, 0))
         daily_stats.append({
-            "date": current_date.strftime("%Y-%m-%d"),
+            "date": d.isoformat(),
             "grammar": grammar_count,
             "dialogue": dialogue_count
         })
-        
-        total_grammar += grammar_count
-        total_dialogue += dialogue_count
     
     return WeeklyStats(
         dailyStats=daily_stats,
-        totalGrammar=total_grammar,
-        totalDialogue=total_dialogue
+        totalGrammar=sum(d["grammar"] for d in daily_stats),
+        totalDialogue=sum(d["dialogue"] for d in daily_stats)
+    )
+
+async def _rollup_counts(db: AsyncSession, user_id: str, start_utc: datetime, end_utc: datetime) -> Dict[str, Tuple[int, int]]:
+    result = await db.execute(
+        select(StudyStats.date, StudyStats.grammar_count, StudyStats.dialogue_count).where(
+            and_(
+                StudyStats.user_id == user_id,
+                StudyStats.date >= start_utc,
+                StudyStats.date < end_utc
+            )
+        )
     )
+    return {row[0].date().isoformat(): (row[1] or 0, row[2] or 0) for row in result.all()}
+
+async def _event_counts(db: AsyncSession, user_id: str, start_utc: datetime, end_utc: datetime, segments: List[Tuple[datetime, int]]) -> Dict[str, Tuple[int, int]]:
+    day = _local_date(PracticeEvent.created_at, segments).label("day")
+    
+    result = await db.execute(
+        select(
+            day,
+            func.sum(case((PracticeEvent.kind == "grammar", 1), else_=0)),
+            func.sum(case((PracticeEvent.kind == "dialogue", 1), else_=0))
+        ).where(
+            and_(
+                PracticeEvent.user_id == user_id,
+                PracticeEvent.created_at >= start_utc,
+                PracticeEvent.created_at < end_utc
+            )
+        ).group_by(day)
+    )
+    return {row[0]: (row[1] or 0, row[2] or 0) for row in result.all()}
 
 @router.get("/stats/export")
 async def export_study_data(
     user_id: str = Query(default="default_user"),
     db: AsyncSession = Depends(get_db)
 ):
-    proficiency_query = select(UserProficiency).where(UserProficiency.user_id == user_id)
-    proficiency_result = await db.execute(proficiency_query)
-    proficiencies = proficiency_result.scalars().all()
-    
-    mistakes_query = select(Mistake).where(Mistake.user_id == user_id)
-    mistakes_result = await db.execute(mistakes_query)
-    mistakes = mistakes_result.scalars().all()
-    
-    dialogue_query = select(DialogueSession).where(DialogueSession.user_id == user_id)
-    dialogue_result = await db.execute(dialogue_query)
-    dialogues = dialogue_result.scalars().all()
-    
-    data_proficiency = []
-    for p in proficiencies:
-        data_proficiency.append({
-            "Grammar ID": p.grammar_id,
-            "Practice Count": p.practice_count,
-            "Correct Count": p.correct_count,
-            "Proficiency Score": p.proficiency_score,
-            "Last Practiced": p.last_practiced.strftime("%Y-%m-%d %H:%M:%S") if p.last_practiced else ""
-        })
-    
-    data_mistakes = []
-    for m in mistakes:
-        data_mistakes.append({
-            "Grammar ID": m.grammar_id,
-            "User Answer": m.user_answer,
-            "Correct Answer": m.correct_answer,
-            "Timestamp": m.timestamp.strftime("%Y-%m-%d %H:%M:%S") if m.timestamp else ""
-        })
-    
-    data_dialogues = []
-    for d in dialogues:
-        data_dialogues.append({
-            "Session ID": d.id,
-            "Scenario": d.scenario,
-            "Message Count": len(d.history) if d.history else 0,
-            "Created At": d.created_at.strftime("%Y-%m-%d %H:%M:%S") if d.created_at else "",
-            "Updated At": d.updated_at.strftime("%Y-%m-%d %H:%M:%S") if d.updated_at else ""
-        })
-    
-    os.makedirs("data", exist_ok=True)
+    # Each request writes its own temp file, removed once the response is sent
+    path = new_export_path()
+    try:
+        await write_study_workbook(db, user_id, path)
+    except Exception:
+        remove_file(path)
+        raise
     
-    with pd.ExcelWriter("data/manaboo_study_data.xlsx", engine='openpyxl') as writer:
-        if data_proficiency:
-            pd.DataFrame(data_proficiency).to_excel(writer, sheet_name='Proficiency', index=False)
-        if data_mistakes:
-            pd.DataFrame(data_mistakes).to_excel(writer, sheet_name='Mistakes', index=False)
-        if data_dialogues:
-            pd.DataFrame(data_dialogues).to_excel(writer, sheet_name='Dialogues', index=False)
+    return FileResponse(
+        path=path,
+        filename="manaboo_study_data.xlsx",
+        media_type=XLSX_MEDIA_TYPE,
+        background=BackgroundTask(remove_file, path)
+    )
+
+@router.post("/stats/export/jobs")
+async def create_export_job(user_id: str = Query(default="default_user")):
+    # Returns the user's current job when an up-to-date one already exists
+    return export_jobs.to_dict(await export_jobs.submit(user_id))
+
+@router.get("/stats/export/jobs/{job_id}")
+async def get_export_job(job_id: str):
+    return export_jobs.to_dict(await _export_job(job_id))
+
+@router.get("/stats/export/jobs/{job_id}/download")
+async def download_export_job(job_id: str):
+    job = await _export_job(job_id)
+    status = export_jobs.status(job)
+    if status != "done" or not job.path or not os.path.exists(job.path):
+        raise HTTPException(status_code=409, detail=f"Export is {status}")
     
     return FileResponse(
-        path="data/manaboo_study_data.xlsx",
+        path=job.path,
         filename="manaboo_study_data.xlsx",
-        media_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        media_type=XLSX_MEDIA_TYPE
     )
 
+async def _export_job(job_id: str):
+    job = await export_jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Export job not found")
+    return job
+
 @router.get("/stats/summary")
 async def get_study_summary(
     user_id: str = Query(default="default_user"),
     db: AsyncSession = Depends(get_db)
 ):
-    total_grammar_query = select(func.count(UserProficiency.id)).where(
-        UserProficiency.user_id == user_id
-    )
-    total_grammar_result = await db.execute(total_grammar_query)
-    total_grammar = total_grammar_result.scalar() or 0
-    
-    mastered_query = select(func.count(UserProficiency.id)).where(
-        and_(
-            UserProficiency.user_id == user_id,
-            UserProficiency.proficiency_score >= 80
-        )
-    )
-    mastered_result = await db.execute(mastered_query)
-    mastered_count = mastered_result.scalar() or 0
-    
-    total_mistakes_query = select(func.count(Mistake.id)).where(
-        Mistake.user_id == user_id
-    )
-    total_mistakes_result = await db.execute(total_mistakes_query)
-    total_mistakes = total_mistakes_result.scalar() or 0
+    summary = summary_cache.get(user_id)
+    if summary is not None:
+        return summary
+    generation = summary_cache.generation
     
-    total_dialogues_query = select(func.count(DialogueSession.id)).where(
-        DialogueSession.user_id == user_id
+    result = await db.execute(
+        select(
+            func.sum(StudyStats.new_grammar_count),
+            func.sum(StudyStats.mastered_count),
+            func.sum(StudyStats.mistake_count),
+            func.sum(StudyStats.new_session_count)
+        ).where(StudyStats.user_id == user_id)
     )
-    total_dialogues_result = await db.execute(total_dialogues_query)
-    total_dialogues = total_dialogues_result.scalar() or 0
+    total_grammar, mastered_count, total_mistakes, total_dialogues = (v or 0 for v in result.one())
     
-    return {
+    summary = {
         "total_grammar_practiced": total_grammar,
         "mastered_grammar": mastered_count,
         "total_mistakes": total_mistakes,
         "total_dialogue_sessions": total_dialogues,
         "mastery_rate": (mastered_count / total_grammar * 100) if total_grammar > 0 else 0
-    }
\ No newline at end of file
+    }
+    summary_cache.set(user_id, summary, generation)
+    return summary
\ No newline at end of file
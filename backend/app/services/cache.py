@@ -0,0 +1,74 @@
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+import time
+
+# Small in-process TTL cache for cheap-to-recompute, frequently polled reads.
+# Each worker keeps its own copy, so the TTL bounds how stale another worker's
+# entry can get; writes in this worker invalidate immediately.
+class TTLCache:
+    def __init__(self, ttl_seconds: float, max_entries: int = 10000):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        # Bumped on every invalidation and recorded against the key. A read
+        # passes the generation it started at, and only a write to that same
+        # key since then keeps its now-stale result out of the cache
+        self.generation = 0
+        self._invalidated: "OrderedDict[Hashable, int]" = OrderedDict()
+        # Generation of the newest invalidation dropped from _invalidated;
+        # keys no longer tracked are treated as invalidated then
+        self._invalidated_floor = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            self._entries.pop(key, None)
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key: Hashable, value: Any, generation: Optional[int] = None):
+        if self.ttl_seconds <= 0:
+            return
+        if generation is not None and generation < self._invalidated.get(key, self._invalidated_floor):
+            return
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key: Hashable):
+        self.generation += 1
+        self._entries.pop(key, None)
+        self._invalidated[key] = self.generation
+        self._invalidated.move_to_end(key)
+        while len(self._invalidated) > self.max_entries:
+            _, self._invalidated_floor = self._invalidated.popitem(last=False)
+
+    def get_metrics(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+# Callbacks run after a transaction that changed a user's study data commits
+_user_data_listeners: List[Callable[[str], None]] = []
+
+def on_user_data_changed(listener: Callable[[str], None]) -> Callable[[str], None]:
+    _user_data_listeners.append(listener)
+    return listener
+
+def notify_user_data_changed(user_id: str):
+    for listener in _user_data_listeners:
+        try:
+            listener(user_id)
+        except Exception as e:
+            print(f"Error in user data listener: {e}")
@@ -0,0 +1,126 @@
+from typing import Dict, List, NamedTuple, Optional, Set
+import os
+
+from sqlalchemy import select, update, and_, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import AsyncSessionLocal, DialogueMessage, DialogueSession
+from app.services.dialogue_store import page_messages
+from app.services.openai_service import openai_service
+from app.utils.tokens import MESSAGE_OVERHEAD_TOKENS, estimate_tokens
+
+# Prompt budget for the summary plus recent turns sent with each reply
+DIALOGUE_CONTEXT_TOKENS = int(os.getenv("DIALOGUE_CONTEXT_TOKENS", "1500"))
+# Most recent messages considered for the window, whatever their size
+DIALOGUE_CONTEXT_MAX_MESSAGES = int(os.getenv("DIALOGUE_CONTEXT_MAX_MESSAGES", "40"))
+DIALOGUE_SUMMARY_TOKENS = int(os.getenv("DIALOGUE_SUMMARY_TOKENS", "300"))
+# Messages left out of a summary so the next window still has verbatim turns
+DIALOGUE_SUMMARY_KEEP_MESSAGES = int(os.getenv("DIALOGUE_SUMMARY_KEEP_MESSAGES", "6"))
+# Transcript size folded into the summary per call; long backlogs catch up over several turns
+DIALOGUE_SUMMARY_INPUT_TOKENS = int(os.getenv("DIALOGUE_SUMMARY_INPUT_TOKENS", "3000"))
+
+class DialogueContext(NamedTuple):
+    summary: Optional[str]
+    history: List[Dict]
+    # True when unsummarized turns fell out of the window
+    needs_summary: bool
+
+EMPTY_CONTEXT = DialogueContext(None, [], False)
+
+# Sessions with a summary call in flight in this process
+_summarizing: Set[str] = set()
+
+def _message_tokens(text: str) -> int:
+    return MESSAGE_OVERHEAD_TOKENS + estimate_tokens(text)
+
+async def build_context(db: AsyncSession, session: DialogueSession) -> DialogueContext:
+    summarized_through = session.summarized_through_seq or 0
+    budget = DIALOGUE_CONTEXT_TOKENS
+    if session.summary:
+        budget -= _message_tokens(session.summary)
+
+    result = await db.execute(
+        select(DialogueMessage.role, DialogueMessage.text)
+        .where(
+            and_(
+                DialogueMessage.session_id == session.id,
+                DialogueMessage.seq > summarized_through
+            )
+        )
+        .order_by(DialogueMessage.seq.desc())
+        .limit(DIALOGUE_CONTEXT_MAX_MESSAGES)
+    )
+
+    history = []
+    for role, text in result.all():
+        cost = _message_tokens(text or "")
+        if cost > budget:
+            break
+        budget -= cost
+        history.append({"role": role, "text": text or ""})
+    history.reverse()
+
+    unsummarized = (session.message_count or 0) - summarized_through
+    return DialogueContext(session.summary, history, unsummarized > len(history))
+
+async def refresh_summary(session_id: str, scenario_name: str):
+    # Folds the oldest unsummarized turns into the session's rolling summary.
+    # Runs after the reply is sent, so it never adds to turn latency.
+    if session_id in _summarizing:
+        return
+    _summarizing.add(session_id)
+
+    try:
+        async with AsyncSessionLocal() as db:
+            session = await db.get(DialogueSession, session_id)
+            if not session:
+                return
+
+            summarized_through = session.summarized_through_seq or 0
+            last_seq = (session.message_count or 0) - DIALOGUE_SUMMARY_KEEP_MESSAGES
+            if last_seq <= summarized_through:
+                return
+
+            messages = await page_messages(db, session_id, summarized_through, last_seq - summarized_through)
+            batch = []
+            budget = DIALOGUE_SUMMARY_INPUT_TOKENS
+            for m in messages:
+                budget -= _message_tokens(m.text or "")
+                if batch and budget < 0:
+                    break
+                batch.append(m)
+            if not batch:
+                return
+            # Don't hold a read transaction open across the LLM call
+            await db.commit()
+
+            summary = await openai_service.summarize_dialogue(
+                scenario_name,
+                session.summary,
+                [{"role": m.role, "text": m.text or ""} for m in batch],
+                DIALOGUE_SUMMARY_TOKENS
+            )
+            if not summary:
+                return
+
+            # Conditional on the old position, so a racing worker can't roll it back
+            await db.execute(
+                update(DialogueSession)
+                .where(
+                    and_(
+                        DialogueSession.id == session_id,
+                        func.coalesce(DialogueSession.summarized_through_seq, 0) == summarized_through
+                    )
+                )
+                .values(
+                    summary=summary,
+                    summarized_through_seq=batch[-1].seq,
+                    updated_at=DialogueSession.updated_at
+                )
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+    except Exception as e:
+        print(f"Error refreshing dialogue summary for {session_id}: {e}")
+    finally:
+        _summarizing.discard(session_id)
@@ -0,0 +1,50 @@
+from datetime import datetime
+from typing import List, Optional, Sequence, Tuple
+
+from sqlalchemy import select, update, delete, and_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import DialogueMessage, DialogueSession
+
+async def append_messages(db: AsyncSession, session_id: str, messages: Sequence[Tuple[str, str]]) -> Optional[int]:
+    # Reserves seqs with a single UPDATE ... RETURNING on the session row, so
+    # concurrent turns get distinct ranges and each turn writes a constant
+    # number of rows however long the conversation is. Returns the last seq,
+    # or None when the session does not exist.
+    now = datetime.utcnow()
+    result = await db.execute(
+        update(DialogueSession)
+        .where(DialogueSession.id == session_id)
+        .values(
+            message_count=DialogueSession.message_count + len(messages),
+            updated_at=now
+        )
+        .returning(DialogueSession.message_count)
+    )
+    last_seq = result.scalar()
+    if last_seq is None:
+        return None
+
+    first_seq = last_seq - len(messages) + 1
+    db.add_all([
+        DialogueMessage(session_id=session_id, seq=first_seq + i, role=role, text=text, created_at=now)
+        for i, (role, text) in enumerate(messages)
+    ])
+    return last_seq
+
+async def page_messages(db: AsyncSession, session_id: str, after_seq: int = 0, limit: Optional[int] = None) -> List[DialogueMessage]:
+    query = select(DialogueMessage).where(
+        and_(
+            DialogueMessage.session_id == session_id,
+            DialogueMessage.seq > after_seq
+        )
+    ).order_by(DialogueMessage.seq)
+
+    if limit:
+        query = query.limit(limit)
+
+    result = await db.execute(query)
+    return list(result.scalars().all())
+
+async def delete_messages(db: AsyncSession, session_id: str):
+    await db.execute(delete(DialogueMessage).where(DialogueMessage.session_id == session_id))
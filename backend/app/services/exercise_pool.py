@@ -0,0 +1,177 @@
+from difflib import SequenceMatcher
+from typing import Dict, List, Optional, Set, Tuple
+import asyncio
+import os
+
+from sqlalchemy import select, delete, and_, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import AsyncSessionLocal, Exercise
+from app.services.grammar_catalog import grammar_catalog, GrammarRecord
+from app.services.openai_service import openai_service
+from app.utils.japanese import normalize_text
+
+# Refill a (grammar_id, type) pool once it drops below the low-water mark
+EXERCISE_POOL_LOW_WATER = int(os.getenv("EXERCISE_POOL_LOW_WATER", "9"))
+EXERCISE_POOL_TARGET = int(os.getenv("EXERCISE_POOL_TARGET", "30"))
+# Generated questions this similar to a pooled one are dropped as duplicates
+EXERCISE_DUPLICATE_RATIO = float(os.getenv("EXERCISE_DUPLICATE_RATIO", "0.9"))
+# Upper bound on LLM calls per refill, so a model that keeps repeating itself can't loop forever
+EXERCISE_REFILL_MAX_CALLS = int(os.getenv("EXERCISE_REFILL_MAX_CALLS", "10"))
+
+def _is_duplicate(question: str, seen: List[str]) -> bool:
+    for other in seen:
+        if question == other:
+            return True
+        if SequenceMatcher(None, question, other).ratio() >= EXERCISE_DUPLICATE_RATIO:
+            return True
+    return False
+
+class ExercisePool:
+    def __init__(self):
+        self._queue: Optional[asyncio.Queue] = None
+        self._queued: Set[Tuple[str, str]] = set()
+        self._worker: Optional[asyncio.Task] = None
+        self._cold_locks: Dict[Tuple[str, str], asyncio.Lock] = {}
+        self.refills = 0
+        self.generated = 0
+        self.duplicates = 0
+
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._worker:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+    async def take(self, db: AsyncSession, grammar: GrammarRecord, exercise_type: str, count: int = 3) -> List[Exercise]:
+        size = await self._size(db, grammar.id, exercise_type)
+
+        if size == 0:
+            # Cold pool: the first caller pays for one generation inline while
+            # concurrent callers wait for it instead of inserting the same
+            # shared completion again
+            await db.commit()
+            async with self._cold_locks.setdefault((grammar.id, exercise_type), asyncio.Lock()):
+                size = await self._size(db, grammar.id, exercise_type)
+                if size == 0:
+                    await self._generate_into(db, grammar, exercise_type, keep_fallback=True)
+                    size = await self._size(db, grammar.id, exercise_type)
+
+        if size < EXERCISE_POOL_LOW_WATER:
+            self.request_refill(grammar.id, exercise_type)
+
+        result = await db.execute(
+            select(Exercise).where(
+                and_(
+                    Exercise.grammar_id == grammar.id,
+                    Exercise.type == exercise_type
+                )
+            ).order_by(func.random()).limit(count)
+        )
+        return list(result.scalars().all())
+
+    def request_refill(self, grammar_id: str, exercise_type: str):
+        key = (grammar_id, exercise_type)
+        if self._queue is None or key in self._queued:
+            return
+        self._queued.add(key)
+        self._queue.put_nowait(key)
+
+    def get_metrics(self) -> Dict:
+        return {
+            "queued_refills": len(self._queued),
+            "refills": self.refills,
+            "generated": self.generated,
+            "duplicates": self.duplicates
+        }
+
+    async def _run(self):
+        while True:
+            key = await self._queue.get()
+            try:
+                await self._refill(*key)
+            except Exception as e:
+                print(f"Error refilling exercise pool {key}: {e}")
+            finally:
+                self._queued.discard(key)
+
+    async def _refill(self, grammar_id: str, exercise_type: str):
+        grammar = grammar_catalog.get(grammar_id)
+        if not grammar:
+            return
+
+        self.refills += 1
+        async with AsyncSessionLocal() as db:
+            for call in range(EXERCISE_REFILL_MAX_CALLS):
+                if await self._size(db, grammar_id, exercise_type) >= EXERCISE_POOL_TARGET:
+                    break
+                # A variant per call, so refills never share an inline caller's completion
+                if not await self._generate_into(db, grammar, exercise_type, variant=f"refill-{self.refills}-{call}"):
+                    break
+
+    async def _size(self, db: AsyncSession, grammar_id: str, exercise_type: str) -> int:
+        result = await db.execute(
+            select(func.count(Exercise.id)).where(
+                and_(
+                    Exercise.grammar_id == grammar_id,
+                    Exercise.type == exercise_type
+                )
+            )
+        )
+        return result.scalar() or 0
+
+    async def _generate_into(self, db: AsyncSession, grammar: GrammarRecord, exercise_type: str, keep_fallback: bool = False, variant: Optional[str] = None) -> int:
+        # End the caller's read (the pool size check) so no pooled connection
+        # sits idle in a transaction for the whole completion
+        await db.commit()
+        exercise_data = await openai_service.generate_exercise(grammar.title, exercise_type, variant)
+
+        # Canned fallback questions only go in when there is nothing else to serve
+        fallback = bool(exercise_data.get("fallback"))
+        if fallback and not keep_fallback:
+            return 0
+        canned = [q["question"] for q in openai_service.get_default_exercise(grammar.title, exercise_type)["questions"]]
+        pool = and_(Exercise.grammar_id == grammar.id, Exercise.type == exercise_type)
+
+        result = await db.execute(select(Exercise.id, Exercise.question).where(pool))
+        rows = result.all()
+        canned_ids = [exercise_id for exercise_id, question in rows if question in canned]
+        seen = [normalize_text(q) for exercise_id, q in rows if fallback or exercise_id not in canned_ids]
+        await db.commit()
+
+        added = 0
+        for q in exercise_data.get("questions", []):
+            if not q.get("question") or not q.get("correct_answer"):
+                continue
+
+            normalized = normalize_text(q["question"])
+            if _is_duplicate(normalized, seen):
+                self.duplicates += 1
+                continue
+            seen.append(normalized)
+
+            db.add(Exercise(
+                grammar_id=grammar.id,
+                type=exercise_type,
+                question=q["question"],
+                options=q.get("options"),
+                correct_answer=q["correct_answer"],
+                explanation=q.get("explanation", "")
+            ))
+            added += 1
+
+        if added and not fallback and canned_ids:
+            # Real questions are in, so the canned ones a cold start stored give way
+            await db.execute(delete(Exercise).where(Exercise.id.in_(canned_ids)))
+        await db.commit()
+        self.generated += added
+        return added
+
+exercise_pool = ExercisePool()
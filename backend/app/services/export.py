@@ -0,0 +1,125 @@
+from datetime import datetime
+from typing import Any, AsyncIterator, Awaitable, Callable, List, Optional, Sequence, Tuple
+import asyncio
+import os
+import tempfile
+
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import DB_PATH, UserProficiency, Mistake, DialogueSession
+
+# Rows fetched from the database and handed to the writer thread at a time
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+# Where export files are written; every worker serving downloads must see it
+EXPORT_DIR = os.getenv("EXPORT_DIR", str(DB_PATH.parent / "exports"))
+
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+def _timestamp(value: datetime) -> str:
+    return value.strftime("%Y-%m-%d %H:%M:%S") if value else ""
+
+def _sheets(user_id: str) -> List[Tuple[str, List[str], Any, Callable[[Sequence], List]]]:
+    return [
+        (
+            "Proficiency",
+            ["Grammar ID", "Practice Count", "Correct Count", "Proficiency Score", "Last Practiced"],
+            select(
+                UserProficiency.grammar_id,
+                UserProficiency.practice_count,
+                UserProficiency.correct_count,
+                UserProficiency.proficiency_score,
+                UserProficiency.last_practiced
+            ).where(UserProficiency.user_id == user_id).order_by(UserProficiency.id),
+            lambda r: [r[0], r[1], r[2], r[3], _timestamp(r[4])]
+        ),
+        (
+            "Mistakes",
+            ["Grammar ID", "User Answer", "Correct Answer", "Timestamp"],
+            select(
+                Mistake.grammar_id,
+                Mistake.user_answer,
+                Mistake.correct_answer,
+                Mistake.timestamp
+            ).where(Mistake.user_id == user_id).order_by(Mistake.id),
+            lambda r: [r[0], r[1], r[2], _timestamp(r[3])]
+        ),
+        (
+            "Dialogues",
+            ["Session ID", "Scenario", "Message Count", "Created At", "Updated At"],
+            select(
+                DialogueSession.id,
+                DialogueSession.scenario,
+                func.coalesce(DialogueSession.message_count, 0),
+                DialogueSession.created_at,
+                DialogueSession.updated_at
+            ).where(DialogueSession.user_id == user_id).order_by(DialogueSession.created_at),
+            lambda r: [r[0], r[1], r[2], _timestamp(r[3]), _timestamp(r[4])]
+        ),
+    ]
+
+async def _batches(db: AsyncSession, query) -> AsyncIterator[Sequence]:
+    result = await db.stream(query.execution_options(yield_per=EXPORT_BATCH_SIZE))
+    async for partition in result.partitions():
+        yield partition
+
+async def study_data_version(db: AsyncSession, user_id: str) -> str:
+    # Changes whenever anything the workbook contains does: answers move the
+    # practice totals, mistakes and sessions their counts and newest rows
+    proficiency = select(func.count(), func.sum(UserProficiency.practice_count), func.max(UserProficiency.last_practiced)).where(
+        UserProficiency.user_id == user_id
+    )
+    mistakes = select(func.count(), func.max(Mistake.id)).where(Mistake.user_id == user_id)
+    sessions = select(func.count(), func.max(DialogueSession.updated_at)).where(DialogueSession.user_id == user_id)
+
+    parts = []
+    for query in (proficiency, mistakes, sessions):
+        result = await db.execute(query)
+        parts.extend(str(value) for value in result.one())
+    return "|".join(parts)
+
+async def count_study_rows(db: AsyncSession, user_id: str) -> int:
+    total = 0
+    for _, _, query, _ in _sheets(user_id):
+        result = await db.execute(select(func.count()).select_from(query.order_by(None).subquery()))
+        total += result.scalar() or 0
+    return total
+
+def _append_rows(sheet, rows: List[List]):
+    for row in rows:
+        sheet.append(row)
+
+async def write_study_workbook(db: AsyncSession, user_id: str, path: str, on_rows: Optional[Callable[[int], Awaitable[None]]] = None):
+    # Server-side cursors feed a write-only workbook, so memory stays at one
+    # batch regardless of history size; all openpyxl work runs off the event loop.
+    # openpyxl is imported here so only exports pay for loading it
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+
+    for title, header, query, to_row in _sheets(user_id):
+        sheet = None
+        async for batch in _batches(db, query):
+            if sheet is None:
+                sheet = workbook.create_sheet(title)
+                sheet.append(header)
+            await asyncio.to_thread(_append_rows, sheet, [to_row(r) for r in batch])
+            if on_rows:
+                await on_rows(len(batch))
+
+    if not workbook.worksheets:
+        workbook.create_sheet("Proficiency").append(_sheets(user_id)[0][1])
+
+    await asyncio.to_thread(workbook.save, path)
+
+def new_export_path(suffix: str = ".xlsx") -> str:
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    fd, path = tempfile.mkstemp(prefix="manaboo_export_", suffix=suffix, dir=EXPORT_DIR)
+    os.close(fd)
+    return path
+
+def remove_file(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
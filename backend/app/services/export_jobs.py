@@ -0,0 +1,182 @@
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Set
+import asyncio
+import os
+import uuid
+
+from sqlalchemy import select, update, delete, or_
+
+from app.database import AsyncSessionLocal, ExportJob
+from app.services.export import count_study_rows, new_export_path, remove_file, study_data_version, write_study_workbook
+
+# Exports running at once in each worker; further jobs wait their turn
+EXPORT_MAX_CONCURRENCY = int(os.getenv("EXPORT_MAX_CONCURRENCY", "2"))
+# Finished jobs (and their files) are dropped after this long
+EXPORT_JOB_TTL_SECONDS = int(os.getenv("EXPORT_JOB_TTL_SECONDS", "3600"))
+# A waiting or running job whose heartbeat is older than this lost its worker
+EXPORT_JOB_STALL_SECONDS = int(os.getenv("EXPORT_JOB_STALL_SECONDS", "60"))
+# How often a waiting or running job writes its heartbeat and progress
+EXPORT_HEARTBEAT_SECONDS = 2.0
+
+# Runs exports as background tasks behind a small semaphore, so a heavy account
+# never holds a request open. Job state lives in the export_jobs table, so a
+# poll or download can land on any worker. The newest export per user is
+# reused until that user's study data changes.
+class ExportJobManager:
+    def __init__(self):
+        self._tasks: Set[asyncio.Task] = set()
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        # Jobs this worker is waiting on or running, by id
+        self._local: Dict[str, str] = {}
+        self.completed = 0
+        self.failed = 0
+        self.reused = 0
+
+    async def submit(self, user_id: str) -> ExportJob:
+        async with AsyncSessionLocal() as db:
+            await self._expire(db)
+
+            version = await study_data_version(db, user_id)
+            result = await db.execute(
+                select(ExportJob).where(
+                    ExportJob.user_id == user_id,
+                    ExportJob.data_version == version,
+                    ExportJob.status.in_(("queued", "running", "done"))
+                ).order_by(ExportJob.created_at.desc()).limit(1)
+            )
+            latest = result.scalar_one_or_none()
+            await db.commit()
+            if latest and self.status(latest) != "failed":
+                self.reused += 1
+                return latest
+
+            job = ExportJob(id=str(uuid.uuid4()), user_id=user_id, status="queued", data_version=version, rows_written=0)
+            db.add(job)
+            await db.commit()
+
+        task = asyncio.create_task(self._run(job.id, user_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+
+    async def get(self, job_id: str) -> Optional[ExportJob]:
+        async with AsyncSessionLocal() as db:
+            return await db.get(ExportJob, job_id)
+
+    def status(self, job: ExportJob) -> str:
+        if job.status in ("queued", "running"):
+            if job.heartbeat_at < datetime.utcnow() - timedelta(seconds=EXPORT_JOB_STALL_SECONDS):
+                return "failed"
+        return job.status
+
+    def to_dict(self, job: ExportJob) -> Dict:
+        status = self.status(job)
+        return {
+            "jobId": job.id,
+            "status": status,
+            "rowsWritten": job.rows_written or 0,
+            "rowsTotal": job.rows_total,
+            "progress": ((job.rows_written or 0) / job.rows_total) if job.rows_total else (1.0 if status == "done" else 0.0),
+            "error": job.error if status == job.status else "Export was interrupted",
+            "createdAt": job.created_at.isoformat(),
+            "finishedAt": job.finished_at.isoformat() if job.finished_at else None
+        }
+
+    async def stop(self):
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def get_metrics(self) -> Dict:
+        return {
+            "max_concurrency": EXPORT_MAX_CONCURRENCY,
+            "queued": sum(1 for s in self._local.values() if s == "queued"),
+            "running": sum(1 for s in self._local.values() if s == "running"),
+            "completed": self.completed,
+            "failed": self.failed,
+            "reused": self.reused
+        }
+
+    async def _run(self, job_id: str, user_id: str):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(EXPORT_MAX_CONCURRENCY)
+
+        self._local[job_id] = "queued"
+        progress = {"rows_written": 0}
+        heartbeat = asyncio.create_task(self._heartbeat(job_id, progress))
+        path = None
+        try:
+            async with self._semaphore:
+                self._local[job_id] = "running"
+                path = new_export_path()
+
+                async def add_rows(count: int):
+                    progress["rows_written"] += count
+
+                async with AsyncSessionLocal() as db:
+                    rows_total = await count_study_rows(db, user_id)
+                    await self._update(job_id, status="running", rows_total=rows_total)
+                    await write_study_workbook(db, user_id, path, on_rows=add_rows)
+                await self._stop_heartbeat(heartbeat)
+                await self._update(job_id, status="done", path=path, finished_at=datetime.utcnow(), **progress)
+                self.completed += 1
+        except asyncio.CancelledError:
+            await self._stop_heartbeat(heartbeat)
+            if path:
+                remove_file(path)
+            try:
+                await self._update(job_id, status="failed", error="Export was interrupted", finished_at=datetime.utcnow())
+            except Exception as e:
+                print(f"Error recording interrupted export {job_id}: {e}")
+            raise
+        except Exception as e:
+            await self._stop_heartbeat(heartbeat)
+            if path:
+                remove_file(path)
+            self.failed += 1
+            print(f"Error exporting study data for {user_id}: {e}")
+            await self._update(job_id, status="failed", error=str(e), finished_at=datetime.utcnow())
+        finally:
+            self._local.pop(job_id, None)
+
+    async def _heartbeat(self, job_id: str, progress: Dict):
+        # Keeps the job visibly alive while it waits for a slot or runs,
+        # carrying the progress made so far
+        while True:
+            await asyncio.sleep(EXPORT_HEARTBEAT_SECONDS)
+            try:
+                await self._update(job_id, **progress)
+            except Exception as e:
+                print(f"Error updating export job {job_id}: {e}")
+
+    async def _stop_heartbeat(self, heartbeat: asyncio.Task):
+        heartbeat.cancel()
+        await asyncio.gather(heartbeat, return_exceptions=True)
+
+    async def _update(self, job_id: str, **values):
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(ExportJob).where(ExportJob.id == job_id).values(heartbeat_at=datetime.utcnow(), **values)
+            )
+            await db.commit()
+
+    async def _expire(self, db):
+        # Any worker can clean up: files sit in the shared export directory
+        cutoff = datetime.utcnow() - timedelta(seconds=EXPORT_JOB_TTL_SECONDS)
+        result = await db.execute(
+            select(ExportJob.id, ExportJob.path).where(
+                or_(ExportJob.finished_at < cutoff, ExportJob.heartbeat_at < cutoff)
+            )
+        )
+        expired = result.all()
+        await db.commit()
+        if not expired:
+            return
+
+        for _, path in expired:
+            if path:
+                remove_file(path)
+        await db.execute(delete(ExportJob).where(ExportJob.id.in_([job_id for job_id, _ in expired])))
+        await db.commit()
+
+export_jobs = ExportJobManager()
@@ -0,0 +1,43 @@
+from typing import Dict, List, Optional
+import re
+
+from app.database import Exercise
+from app.utils.japanese import normalize_answer
+
+# Question types with a single expected answer that can be checked without the LLM
+LOCALLY_GRADED_TYPES = {"choice", "fill_in_the_blank"}
+
+_OPTION_LABEL = re.compile(r"^\s*(?:[A-Da-d]|[1-4]|[ＡＢＣＤ１２３４])\s*[.)．、:：]?\s*$")
+_OPTION_PREFIX = re.compile(r"^\s*(?:[A-Da-d]|[1-4]|[ＡＢＣＤ１２３４])\s*[.)．、:：]\s*")
+
+def _choice_answer(correct_answer: str, options: Optional[List[str]]) -> str:
+    # Generated answers sometimes name the option ("B" / "2.") instead of quoting it;
+    # an answer that is itself one of the options is taken as written
+    if options and correct_answer in options:
+        return correct_answer
+    if options and _OPTION_LABEL.match(correct_answer):
+        label = normalize_answer(correct_answer).strip(".)")
+        index = "abcd".find(label) if label.isalpha() else int(label) - 1
+        if 0 <= index < len(options):
+            return options[index]
+    return _OPTION_PREFIX.sub("", correct_answer)
+
+def grade_locally(exercise: Exercise, user_answer: str) -> Optional[Dict]:
+    if exercise.type not in LOCALLY_GRADED_TYPES:
+        return None
+
+    correct_answer = exercise.correct_answer or ""
+    if exercise.type == "choice":
+        correct_answer = _choice_answer(correct_answer, exercise.options)
+        if not (exercise.options and user_answer in exercise.options):
+            user_answer = _OPTION_PREFIX.sub("", user_answer)
+
+    is_correct = normalize_answer(user_answer) == normalize_answer(correct_answer)
+    explanation = exercise.explanation or ""
+
+    return {
+        "result": "correct" if is_correct else "incorrect",
+        "explanation": explanation or ("答案正确！" if is_correct else f"正确答案是：{correct_answer}"),
+        "suggestion": None if is_correct else correct_answer,
+        "correct_answer": correct_answer
+    }
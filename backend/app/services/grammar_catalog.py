@@ -0,0 +1,108 @@
+from bisect import bisect_left
+from datetime import datetime
+from types import MappingProxyType
+from typing import Dict, List, Mapping, NamedTuple, Optional, Tuple
+import asyncio
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import AsyncSessionLocal, Grammar
+
+class GrammarRecord(NamedTuple):
+    id: str
+    level: str
+    title: str
+    structure: str
+    usage: str
+    examples: Tuple[Mapping[str, str], ...]
+    themes: Tuple[str, ...]
+
+class _Snapshot(NamedTuple):
+    records: Tuple[GrammarRecord, ...]
+    by_id: Dict[str, GrammarRecord]
+    by_level: Dict[str, Tuple[GrammarRecord, ...]]
+    by_theme: Dict[str, Tuple[GrammarRecord, ...]]
+
+_EMPTY = _Snapshot((), {}, {}, {})
+
+def _to_record(g: Grammar) -> GrammarRecord:
+    return GrammarRecord(
+        id=g.id,
+        level=g.level or "",
+        title=g.title,
+        structure=g.structure,
+        usage=g.usage,
+        examples=tuple(MappingProxyType(dict(e)) for e in (g.examples or [])),
+        themes=tuple(g.themes or [])
+    )
+
+def _build_snapshot(records: List[GrammarRecord]) -> _Snapshot:
+    # N5 first, then by id within a level; every index keeps this order
+    records = sorted(records, key=lambda r: r.id)
+    records.sort(key=lambda r: r.level, reverse=True)
+
+    by_level: Dict[str, List[GrammarRecord]] = {}
+    by_theme: Dict[str, List[GrammarRecord]] = {}
+    for r in records:
+        by_level.setdefault(r.level, []).append(r)
+        for theme in r.themes:
+            by_theme.setdefault(theme, []).append(r)
+
+    return _Snapshot(
+        records=tuple(records),
+        by_id={r.id: r for r in records},
+        by_level={k: tuple(v) for k, v in by_level.items()},
+        by_theme={k: tuple(v) for k, v in by_theme.items()}
+    )
+
+# Process-wide read-only view of the grammar table. It is loaded at startup and
+# replaced wholesale by reload(), so readers never see a half-built index.
+class GrammarCatalog:
+    def __init__(self):
+        self._snapshot = _EMPTY
+        self._lock = asyncio.Lock()
+        self.loaded_at: Optional[datetime] = None
+
+    async def load(self, db: Optional[AsyncSession] = None):
+        async with self._lock:
+            if db is None:
+                async with AsyncSessionLocal() as session:
+                    result = await session.execute(select(Grammar))
+            else:
+                result = await db.execute(select(Grammar))
+
+            self._snapshot = _build_snapshot([_to_record(g) for g in result.scalars().all()])
+            self.loaded_at = datetime.utcnow()
+
+    async def reload(self):
+        await self.load()
+
+    def get(self, grammar_id: str) -> Optional[GrammarRecord]:
+        return self._snapshot.by_id.get(grammar_id)
+
+    def filter(self, level: Optional[str] = None, theme: Optional[str] = None) -> Tuple[GrammarRecord, ...]:
+        snapshot = self._snapshot
+
+        if level and theme:
+            return tuple(r for r in snapshot.by_theme.get(theme, ()) if r.level == level)
+        if level:
+            return snapshot.by_level.get(level, ())
+        if theme:
+            return snapshot.by_theme.get(theme, ())
+        return snapshot.records
+
+    @staticmethod
+    def page_after(records: Tuple[GrammarRecord, ...], level: str, grammar_id: str) -> Tuple[GrammarRecord, ...]:
+        # records are ordered by (level desc, id), so "comes after the cursor" is monotone
+        start = bisect_left(
+            records,
+            True,
+            key=lambda r: r.level < level or (r.level == level and r.id > grammar_id)
+        )
+        return records[start:]
+
+    def __len__(self) -> int:
+        return len(self._snapshot.records)
+
+grammar_catalog = GrammarCatalog()
@@ -0,0 +1,125 @@
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+import hashlib
+import os
+
+from sqlalchemy import select, update, delete, func
+
+from app.database import AsyncSessionLocal, LLMCacheEntry, dialect_insert
+from app.utils.japanese import canonical_text
+
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() != "false"
+LLM_CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", str(30 * 24 * 3600)))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "50000"))
+# Eviction runs every N writes rather than on each one
+LLM_CACHE_EVICT_EVERY = 200
+# Skip rewriting last_accessed for entries touched more recently than this
+LLM_CACHE_TOUCH_INTERVAL = timedelta(minutes=5)
+
+# Persistent cache of LLM responses, keyed on method, prompt version, model and
+# normalized inputs. Stored in the application database so hits survive restarts
+# and are shared by every worker.
+class LLMCache:
+    def __init__(self):
+        self.enabled = LLM_CACHE_ENABLED
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.errors = 0
+        self._writes = 0
+
+    @staticmethod
+    def make_key(method: str, prompt_version: str, model: str, *inputs: str) -> str:
+        parts = [method, prompt_version, model] + [canonical_text(i) for i in inputs]
+        return hashlib.sha256("\x1f".join(parts).encode()).hexdigest()
+
+    async def get(self, key: str) -> Optional[Dict]:
+        if not self.enabled:
+            return None
+
+        try:
+            async with AsyncSessionLocal() as db:
+                entry = await db.get(LLMCacheEntry, key)
+                now = datetime.utcnow()
+
+                if entry is None:
+                    self.misses += 1
+                    return None
+
+                if entry.created_at < now - timedelta(seconds=LLM_CACHE_TTL_SECONDS):
+                    self.misses += 1
+                    await db.commit()
+                    await db.execute(delete(LLMCacheEntry).where(LLMCacheEntry.key == key))
+                    await db.commit()
+                    return None
+
+                self.hits += 1
+                if entry.last_accessed is None or now - entry.last_accessed > LLM_CACHE_TOUCH_INTERVAL:
+                    # Fresh write transaction; a SQLite WAL reader can't be upgraded in place
+                    await db.commit()
+                    await db.execute(
+                        update(LLMCacheEntry).where(LLMCacheEntry.key == key).values(last_accessed=now)
+                    )
+                    await db.commit()
+                return entry.response
+        except Exception as e:
+            self.errors += 1
+            print(f"Error reading LLM cache: {e}")
+            return None
+
+    async def set(self, key: str, method: str, prompt_version: str, model: str, response: Dict):
+        if not self.enabled:
+            return
+
+        try:
+            async with AsyncSessionLocal() as db:
+                now = datetime.utcnow()
+                values = dict(
+                    method=method,
+                    model=model,
+                    prompt_version=prompt_version,
+                    response=response,
+                    created_at=now,
+                    last_accessed=now
+                )
+                await db.execute(
+                    dialect_insert(LLMCacheEntry).values(key=key, **values).on_conflict_do_update(
+                        index_elements=[LLMCacheEntry.key],
+                        set_=values
+                    )
+                )
+                await db.commit()
+
+                self._writes += 1
+                if self._writes % LLM_CACHE_EVICT_EVERY == 0:
+                    await self._evict(db)
+        except Exception as e:
+            self.errors += 1
+            print(f"Error writing LLM cache: {e}")
+
+    async def _evict(self, db):
+        cutoff = datetime.utcnow() - timedelta(seconds=LLM_CACHE_TTL_SECONDS)
+        expired = await db.execute(delete(LLMCacheEntry).where(LLMCacheEntry.created_at < cutoff))
+        self.evictions += expired.rowcount or 0
+
+        count = (await db.execute(select(func.count(LLMCacheEntry.key)))).scalar() or 0
+        excess = count - LLM_CACHE_MAX_ENTRIES
+        if excess > 0:
+            oldest = select(LLMCacheEntry.key).order_by(LLMCacheEntry.last_accessed).limit(excess)
+            evicted = await db.execute(delete(LLMCacheEntry).where(LLMCacheEntry.key.in_(oldest)))
+            self.evictions += evicted.rowcount or 0
+
+        await db.commit()
+
+    def get_metrics(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "errors": self.errors
+        }
+
+llm_cache = LLMCache()
@@ -0,0 +1,125 @@
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Sequence, Tuple
+import time
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# In-process metrics rendered in the Prometheus text format, so a scraper can
+# read /metrics without a client library. Each process keeps its own numbers.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LLM_LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 40.0, 80.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def _format_labels(names: Sequence[str], values: Sequence[str], le: Optional[str] = None) -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if le is not None:
+        parts.append(f'le="{le}"')
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *label_values: str, amount: float = 1):
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for label_values, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {value}")
+        return lines
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # label values -> [per-bucket counts..., +Inf count, sum]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, *label_values: str):
+        series = self._values.get(label_values)
+        if series is None:
+            series = self._values[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for label_values, series in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, label_values, str(bound))} {cumulative}")
+            cumulative += series[len(self.buckets)]
+            lines.append(f"{self.name}_bucket{_format_labels(self.labels, label_values, '+Inf')} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, label_values)} {series[-1]}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, label_values)} {cumulative}")
+        return lines
+
+http_requests = Counter("http_requests_total", "HTTP requests by route and status", ["method", "route", "status"])
+http_latency = Histogram("http_request_duration_seconds", "HTTP request latency until the response starts", ["method", "route"])
+request_queries = Histogram("db_queries_per_request", "SQL statements executed per HTTP request", ["method", "route"], QUERY_COUNT_BUCKETS)
+request_query_time = Histogram("db_query_seconds_per_request", "Time spent in SQL per HTTP request", ["method", "route"])
+db_queries = Counter("db_queries_total", "SQL statements executed, including background work")
+llm_latency = Histogram("llm_request_duration_seconds", "LLM call latency", ["method", "model"], LLM_LATENCY_BUCKETS)
+llm_tokens = Counter("llm_tokens_total", "LLM tokens reported by the API", ["method", "model", "kind"])
+llm_errors = Counter("llm_errors_total", "Failed LLM calls", ["method", "model"])
+llm_coalesced = Counter("llm_coalesced_total", "LLM calls served by an identical in-flight call", ["method", "model"])
+
+REGISTRY = [http_requests, http_latency, request_queries, request_query_time, db_queries, llm_latency, llm_tokens, llm_errors, llm_coalesced]
+
+# [statement count, seconds in SQL] for the HTTP request being served
+_request_db: ContextVar[Optional[List[float]]] = ContextVar("request_db", default=None)
+
+def start_request() -> List[float]:
+    stats = [0, 0.0]
+    _request_db.set(stats)
+    return stats
+
+def observe_request(method: str, route: str, status: int, seconds: float, stats: List[float]):
+    http_requests.inc(method, route, str(status))
+    http_latency.observe(seconds, method, route)
+    request_queries.observe(stats[0], method, route)
+    request_query_time.observe(stats[1], method, route)
+
+def observe_llm(method: str, model: str, seconds: float, usage=None, failed: bool = False):
+    llm_latency.observe(seconds, method, model)
+    if failed:
+        llm_errors.inc(method, model)
+    if usage is not None:
+        llm_tokens.inc(method, model, "prompt", amount=getattr(usage, "prompt_tokens", 0) or 0)
+        llm_tokens.inc(method, model, "completion", amount=getattr(usage, "completion_tokens", 0) or 0)
+
+def observe_coalesced(method: str, model: str):
+    llm_coalesced.inc(method, model)
+
+def instrument_engine(engine: Engine):
+    @event.listens_for(engine, "before_cursor_execute")
+    def _start_query(conn, cursor, statement, parameters, context, executemany):
+        conn.info["metrics_started_at"] = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _end_query(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.pop("metrics_started_at", None)
+        db_queries.inc()
+        stats = _request_db.get()
+        if stats is not None and started is not None:
+            stats[0] += 1
+            stats[1] += time.perf_counter() - started
+
+def render() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
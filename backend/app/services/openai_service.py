@@ -1,18 +1,145 @@
 import openai
+import httpx
+import asyncio
+import copy
 import json
 import os
-from typing import Dict, List, Optional
+import time
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
 from dotenv import load_dotenv
 
+from app.services.llm_cache import llm_cache
+from app.services.metrics import observe_coalesced, observe_llm
+
 load_dotenv()
 
 openai.api_key = os.getenv("OPENAI_API_KEY")
 
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-3.5-turbo")
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "60"))
+# Upper bound on completions in flight per process; extra callers wait in line
+OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", "32"))
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "100"))
+# Concurrent identical requests share one in-flight completion
+OPENAI_COALESCE = os.getenv("OPENAI_COALESCE", "true").lower() == "true"
+
+# Bump when a prompt template changes so cached responses for the old wording are ignored
+CHECK_ANSWER_PROMPT_VERSION = "1"
+CORRECT_JAPANESE_PROMPT_VERSION = "1"
+
 class OpenAIService:
     def __init__(self):
-        self.client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        self.model = OPENAI_MODEL
+        self.client = openai.AsyncOpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            timeout=OPENAI_TIMEOUT,
+            http_client=openai.DefaultAsyncHttpxClient(
+                limits=httpx.Limits(
+                    max_connections=OPENAI_MAX_CONNECTIONS,
+                    max_keepalive_connections=OPENAI_MAX_CONNECTIONS
+                )
+            )
+        )
+        self.max_concurrency = OPENAI_MAX_CONCURRENCY
+        self._semaphore = asyncio.Semaphore(OPENAI_MAX_CONCURRENCY)
+        self._queued = 0
+        self._in_flight = 0
+        self._completed = 0
+        self._failed = 0
+        self._flights: Dict[str, asyncio.Task] = {}
+        self._coalesced = 0
+    
+    async def _acquire(self):
+        self._queued += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self._queued -= 1
+        self._in_flight += 1
+    
+    def _release(self):
+        self._in_flight -= 1
+        self._semaphore.release()
+    
+    async def _complete(self, method: str, **kwargs):
+        await self._acquire()
+        started = time.perf_counter()
+        try:
+            response = await self.client.chat.completions.create(model=self.model, **kwargs)
+            self._completed += 1
+            observe_llm(method, self.model, time.perf_counter() - started, usage=response.usage)
+            return response
+        except Exception:
+            self._failed += 1
+            observe_llm(method, self.model, time.perf_counter() - started, failed=True)
+            raise
+        finally:
+            self._release()
+    
+    async def _single_flight(self, method: str, inputs: Tuple[str, ...], call: Callable[[], Awaitable[Dict]]) -> Dict:
+        # The first caller for a normalized input starts the call; callers that
+        # arrive while it is running await the same task and get their own
+        # copy of the result. The task is shielded, so one caller going away
+        # doesn't cancel it for the rest.
+        if not OPENAI_COALESCE:
+            return await call()
+        
+        key = llm_cache.make_key(method, "flight", self.model, *inputs)
+        task = self._flights.get(key)
+        if task is not None:
+            self._coalesced += 1
+            observe_coalesced(method, self.model)
+            return copy.deepcopy(await asyncio.shield(task))
+        
+        task = asyncio.ensure_future(call())
+        self._flights[key] = task
+        task.add_done_callback(lambda _: self._flights.pop(key, None))
+        return await asyncio.shield(task)
+    
+    async def _stream(self, method: str, **kwargs) -> AsyncIterator[str]:
+        # Holds a concurrency slot until the stream is exhausted or closed
+        await self._acquire()
+        started = time.perf_counter()
+        try:
+            stream = await self.client.chat.completions.create(model=self.model, stream=True, **kwargs)
+            async with stream:
+                async for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
+            self._completed += 1
+            observe_llm(method, self.model, time.perf_counter() - started)
+        except Exception:
+            self._failed += 1
+            observe_llm(method, self.model, time.perf_counter() - started, failed=True)
+            raise
+        finally:
+            self._release()
+    
+    def get_metrics(self) -> Dict:
+        return {
+            "model": self.model,
+            "max_concurrency": self.max_concurrency,
+            "queued": self._queued,
+            "in_flight": self._in_flight,
+            "completed": self._completed,
+            "failed": self._failed,
+            "coalesced": self._coalesced,
+            "flights": len(self._flights)
+        }
+    
+    async def close(self):
+        await self.client.close()
+    
+    async def generate_exercise(self, grammar: str, exercise_type: str, variant: Optional[str] = None) -> Dict:
+        # Callers that want their own questions rather than a concurrent
+        # caller's pass a distinct variant
+        return await self._single_flight(
+            "generate_exercise",
+            (grammar, exercise_type, variant or ""),
+            lambda: self._generate_exercise(grammar, exercise_type)
+        )
     
-    async def generate_exercise(self, grammar: str, exercise_type: str) -> Dict:
+    async def _generate_exercise(self, grammar: str, exercise_type: str) -> Dict:
         prompt = f"""
         你是日语教师，请为语法「{grammar}」生成 3 道 {exercise_type} 练习题。
         输出 JSON 格式，包括：
@@ -25,8 +152,8 @@ class OpenAIService:
         """
         
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-3.5-turbo",
+            response = await self._complete(
+                "generate_exercise",
                 messages=[
                     {"role": "system", "content": "You are a Japanese language teacher. Always respond in valid JSON format."},
                     {"role": "user", "content": prompt}
@@ -38,9 +165,23 @@ class OpenAIService:
             return json.loads(response.choices[0].message.content)
         except Exception as e:
             print(f"Error generating exercise: {e}")
-            return self._get_default_exercise(grammar, exercise_type)
+            return self.get_default_exercise(grammar, exercise_type)
     
     async def check_answer(self, grammar: str, user_answer: str, correct_answer: str) -> Dict:
+        return await self._single_flight(
+            "check_answer",
+            (grammar, user_answer, correct_answer),
+            lambda: self._check_answer(grammar, user_answer, correct_answer)
+        )
+    
+    async def _check_answer(self, grammar: str, user_answer: str, correct_answer: str) -> Dict:
+        cache_key = llm_cache.make_key(
+            "check_answer", CHECK_ANSWER_PROMPT_VERSION, self.model, grammar, user_answer, correct_answer
+        )
+        cached = await llm_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
         prompt = f"""
         以下是用户提交的回答，请判断正误并用中文解释：
         - 语法点：「{grammar}」
@@ -54,8 +195,8 @@ class OpenAIService:
         """
         
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-3.5-turbo",
+            response = await self._complete(
+                "check_answer",
                 messages=[
                     {"role": "system", "content": "You are a Japanese language teacher. Always respond in valid JSON format."},
                     {"role": "user", "content": prompt}
@@ -64,30 +205,105 @@ class OpenAIService:
                 response_format={"type": "json_object"}
             )
             
-            return json.loads(response.choices[0].message.content)
+            result = json.loads(response.choices[0].message.content)
+            await llm_cache.set(cache_key, "check_answer", CHECK_ANSWER_PROMPT_VERSION, self.model, result)
+            return result
         except Exception as e:
             print(f"Error checking answer: {e}")
-            is_correct = user_answer.strip() == correct_answer.strip()
-            return {
-                "result": "correct" if is_correct else "incorrect",
-                "explanation": "答案正确！" if is_correct else f"正确答案是：{correct_answer}",
-                "suggestion": None if is_correct else correct_answer
-            }
+            return self._fallback_check(user_answer, correct_answer)
+    
+    async def check_answers(self, items: List[Tuple[str, str, str]]) -> List[Dict]:
+        # Grades (grammar, user_answer, correct_answer) items with one completion
+        # for every cache miss. Results share check_answer's cache entries, so a
+        # batch and single submits never grade the same answer twice.
+        keys = [
+            llm_cache.make_key("check_answer", CHECK_ANSWER_PROMPT_VERSION, self.model, *item)
+            for item in items
+        ]
+        results = [await llm_cache.get(key) for key in keys]
+        missing = [i for i, r in enumerate(results) if r is None]
+        
+        if len(missing) == 1:
+            results[missing[0]] = await self.check_answer(*items[missing[0]])
+            return results
+        if not missing:
+            return results
+        
+        answers = "\n".join(
+            f"{n}. 语法点：「{items[i][0]}」 用户作答：「{items[i][1]}」 正确答案：「{items[i][2]}」"
+            for n, i in enumerate(missing, 1)
+        )
+        prompt = f"""
+        以下是用户提交的多道题的回答，请逐题判断正误并用中文解释：
+        {answers}
+        
+        请输出JSON格式：{{"results": [...]}}，按题号顺序每题一项，包含：
+        - index: 题号
+        - result: 判断结果（correct/incorrect）
+        - explanation: 中文解释
+        - suggestion: 建议改写（如果错误）
+        """
+        
+        graded = {}
+        try:
+            response = await self._complete(
+                "check_answers",
+                messages=[
+                    {"role": "system", "content": "You are a Japanese language teacher. Always respond in valid JSON format."},
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=0.5,
+                response_format={"type": "json_object"}
+            )
+            
+            for n, entry in enumerate(json.loads(response.choices[0].message.content).get("results") or [], 1):
+                if isinstance(entry, dict) and entry.get("result") in ("correct", "incorrect"):
+                    graded[int(entry.get("index") or n)] = {
+                        "result": entry["result"],
+                        "explanation": entry.get("explanation") or "",
+                        "suggestion": entry.get("suggestion")
+                    }
+        except Exception as e:
+            print(f"Error checking answers: {e}")
+        
+        for n, i in enumerate(missing, 1):
+            if n in graded:
+                results[i] = graded[n]
+                await llm_cache.set(keys[i], "check_answer", CHECK_ANSWER_PROMPT_VERSION, self.model, graded[n])
+            else:
+                results[i] = self._fallback_check(items[i][1], items[i][2])
+        return results
+    
+    def _fallback_check(self, user_answer: str, correct_answer: str) -> Dict:
+        is_correct = user_answer.strip() == correct_answer.strip()
+        return {
+            "result": "correct" if is_correct else "incorrect",
+            "explanation": "答案正确！" if is_correct else f"正确答案是：{correct_answer}",
+            "suggestion": None if is_correct else correct_answer
+        }
     
-    async def generate_dialogue_response(self, scenario: str, user_message: str, history: List[Dict]) -> Dict:
+    def _dialogue_messages(self, scenario: str, user_message: str, history: List[Dict], summary: Optional[str] = None) -> List[Dict]:
+        # history is the already-budgeted window of earlier turns, without user_message
         context = f"你正在进行{scenario}场景的日语对话练习。"
         messages = [
             {"role": "system", "content": f"{context} 请用自然的日语回复用户，并保持对话连贯。"}
         ]
         
-        for msg in history[-5:]:
+        if summary:
+            messages.append({"role": "system", "content": f"之前的对话摘要：{summary}"})
+        
+        for msg in history:
             messages.append({"role": msg["role"], "content": msg["text"]})
         
         messages.append({"role": "user", "content": user_message})
+        return messages
+    
+    async def generate_dialogue_response(self, scenario: str, user_message: str, history: List[Dict], summary: Optional[str] = None) -> Dict:
+        messages = self._dialogue_messages(scenario, user_message, history, summary)
         
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-3.5-turbo",
+            response = await self._complete(
+                "generate_dialogue_response",
                 messages=messages,
                 temperature=0.8
             )
@@ -97,7 +313,54 @@ class OpenAIService:
             print(f"Error generating dialogue: {e}")
             return {"reply": "すみません、もう一度お願いします。"}
     
+    async def stream_dialogue_response(self, scenario: str, user_message: str, history: List[Dict], summary: Optional[str] = None) -> AsyncIterator[str]:
+        messages = self._dialogue_messages(scenario, user_message, history, summary)
+        streamed = False
+        
+        try:
+            async for token in self._stream("stream_dialogue_response", messages=messages, temperature=0.8):
+                streamed = True
+                yield token
+        except Exception as e:
+            print(f"Error streaming dialogue: {e}")
+            if not streamed:
+                yield "すみません、もう一度お願いします。"
+    
+    async def summarize_dialogue(self, scenario: str, summary: Optional[str], history: List[Dict], max_tokens: int) -> Optional[str]:
+        transcript = "\n".join(f"{m['role']}: {m['text']}" for m in history)
+        prompt = f"""
+        请把以下{scenario}场景的日语对话压缩成简洁的中文摘要，保留人物、已确定的事实、
+        用户的目标和尚未解决的问题，供后续对话参考。
+        之前的摘要：{summary or "（无）"}
+        新的对话：
+        {transcript}
+        """
+        
+        try:
+            response = await self._complete(
+                "summarize_dialogue",
+                messages=[
+                    {"role": "system", "content": "You summarize conversations for a Japanese tutor. Reply with the summary only."},
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=0.3,
+                max_tokens=max_tokens
+            )
+            
+            return (response.choices[0].message.content or "").strip() or None
+        except Exception as e:
+            print(f"Error summarizing dialogue: {e}")
+            return None
+    
     async def correct_japanese(self, message: str) -> Dict:
+        return await self._single_flight("correct_japanese", (message,), lambda: self._correct_japanese(message))
+    
+    async def _correct_japanese(self, message: str) -> Dict:
+        cache_key = llm_cache.make_key("correct_japanese", CORRECT_JAPANESE_PROMPT_VERSION, self.model, message)
+        cached = await llm_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
         prompt = f"""
         请检查这句日语是否自然，有无语法错误、表达不自然的地方。
         提供更自然的表达、解释原因，并翻译为中文。
@@ -110,8 +373,8 @@ class OpenAIService:
         """
         
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-3.5-turbo",
+            response = await self._complete(
+                "correct_japanese",
                 messages=[
                     {"role": "system", "content": "You are a Japanese language teacher. Always respond in valid JSON format."},
                     {"role": "user", "content": prompt}
@@ -120,7 +383,9 @@ class OpenAIService:
                 response_format={"type": "json_object"}
             )
             
-            return json.loads(response.choices[0].message.content)
+            result = json.loads(response.choices[0].message.content)
+            await llm_cache.set(cache_key, "correct_japanese", CORRECT_JAPANESE_PROMPT_VERSION, self.model, result)
+            return result
         except Exception as e:
             print(f"Error correcting Japanese: {e}")
             return {
@@ -129,9 +394,11 @@ class OpenAIService:
                 "zh": "无法翻译"
             }
     
-    def _get_default_exercise(self, grammar: str, exercise_type: str) -> Dict:
+    def get_default_exercise(self, grammar: str, exercise_type: str) -> Dict:
+        # "fallback" lets callers tell canned questions from generated ones
         if exercise_type == "choice":
             return {
+                "fallback": True,
                 "questions": [
                     {
                         "question": f"次の文の（　）に入る正しいものを選びなさい。\n昨日は雨（　）、試合は中止になった。",
@@ -143,6 +410,7 @@ class OpenAIService:
             }
         elif exercise_type == "fill_in_the_blank":
             return {
+                "fallback": True,
                 "questions": [
                     {
                         "question": f"次の文の（　）に「{grammar}」を使って適切な形を入れなさい。",
@@ -153,6 +421,7 @@ class OpenAIService:
             }
         else:
             return {
+                "fallback": True,
                 "questions": [
                     {
                         "question": f"「{grammar}」を使って文を作りなさい。",
@@ -0,0 +1,46 @@
+from datetime import datetime, timedelta
+from typing import NamedTuple
+
+# SM-2 style spaced repetition over binary grading. Answers are only right or
+# wrong, so a correct answer counts as quality 5 and a wrong one as quality 2.
+DEFAULT_EASE = 2.5
+MIN_EASE = 1.3
+CORRECT_QUALITY = 5
+INCORRECT_QUALITY = 2
+# Ease only grows on a streak of hits, so intervals are capped before they
+# run past what a datetime can hold
+MAX_INTERVAL_DAYS = 365.0
+
+class ReviewState(NamedTuple):
+    ease: float
+    interval_days: float
+    repetitions: int
+    due_at: datetime
+
+def _next_ease(ease: float, quality: int) -> float:
+    return round(max(MIN_EASE, ease + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02)), 2)
+
+def schedule(state: ReviewState, is_correct: bool, now: datetime) -> ReviewState:
+    # Applies one review: the grade for everything answered on a point in one
+    # sitting. A miss resets the streak and makes the point due again straight
+    # away; a hit pushes it out 1 day, 6 days, then interval * ease. A hit
+    # before the point is due leaves the schedule alone, so practising early
+    # doesn't count as a spaced review.
+    ease, interval, repetitions = state.ease or DEFAULT_EASE, state.interval_days or 0.0, state.repetitions or 0
+
+    if is_correct and repetitions and state.due_at and now < state.due_at:
+        return ReviewState(ease, interval, repetitions, state.due_at)
+
+    ease = _next_ease(ease, CORRECT_QUALITY if is_correct else INCORRECT_QUALITY)
+    if not is_correct:
+        return ReviewState(ease, 0.0, 0, now)
+
+    repetitions += 1
+    if repetitions == 1:
+        interval = 1.0
+    elif repetitions == 2:
+        interval = 6.0
+    else:
+        interval = min(MAX_INTERVAL_DAYS, round(interval * ease, 2))
+
+    return ReviewState(ease, interval, repetitions, now + timedelta(days=interval))
@@ -0,0 +1,101 @@
+from datetime import datetime
+from typing import Optional
+import os
+
+from sqlalchemy import and_, case, cast, event, update, Integer, literal
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.database import dialect_insert, seconds_between, StudyStats
+from app.services.cache import notify_user_data_changed
+
+# Activities closer together than this count as continuous study time
+STUDY_ACTIVE_GAP_SECONDS = int(os.getenv("STUDY_ACTIVE_GAP_SECONDS", "600"))
+
+def day_start(moment: datetime) -> datetime:
+    return datetime(moment.year, moment.month, moment.day)
+
+async def record_daily_activity(
+    db: AsyncSession,
+    user_id: str,
+    grammar: int = 0,
+    dialogue: int = 0,
+    mistakes: int = 0,
+    mastered: int = 0,
+    new_grammar: int = 0,
+    new_sessions: int = 0,
+    now: Optional[datetime] = None
+):
+    # Adds to the user's rollup row for the current UTC day inside the caller's
+    # transaction; one upsert, so concurrent writers never lose increments
+    now = now or datetime.utcnow()
+
+    gap = seconds_between(literal(now), StudyStats.last_activity_at)
+    added_seconds = case(
+        (and_(gap >= 0, gap <= STUDY_ACTIVE_GAP_SECONDS), cast(gap, Integer)),
+        else_=0
+    )
+    total_seconds = StudyStats.total_time_seconds + added_seconds
+
+    stmt = dialect_insert(StudyStats).values(
+        user_id=user_id,
+        date=day_start(now),
+        grammar_count=grammar,
+        dialogue_count=dialogue,
+        mistake_count=mistakes,
+        mastered_count=mastered,
+        new_grammar_count=new_grammar,
+        new_session_count=new_sessions,
+        total_time_seconds=0,
+        total_time_minutes=0,
+        last_activity_at=now
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[StudyStats.user_id, StudyStats.date],
+        set_={
+            "grammar_count": StudyStats.grammar_count + grammar,
+            "dialogue_count": StudyStats.dialogue_count + dialogue,
+            "mistake_count": StudyStats.mistake_count + mistakes,
+            "mastered_count": StudyStats.mastered_count + mastered,
+            "new_grammar_count": StudyStats.new_grammar_count + new_grammar,
+            "new_session_count": StudyStats.new_session_count + new_sessions,
+            "total_time_seconds": total_seconds,
+            "total_time_minutes": total_seconds // 60,
+            "last_activity_at": now
+        }
+    )
+    await db.execute(stmt)
+    db.info.setdefault("changed_users", set()).add(user_id)
+
+async def record_session_change(db: AsyncSession, user_id: str, created_at: datetime, change: int):
+    # Counts a dialogue session created (1) or deleted (-1) against the day it
+    # was created. Opening or deleting a session is not study, so study time
+    # and last_activity_at stay as they are.
+    date = day_start(created_at)
+    if change > 0:
+        stmt = dialect_insert(StudyStats).values(
+            user_id=user_id,
+            date=date,
+            new_session_count=change
+        ).on_conflict_do_update(
+            index_elements=[StudyStats.user_id, StudyStats.date],
+            set_={"new_session_count": StudyStats.new_session_count + change}
+        )
+    else:
+        # Only a day that counted the session can give it back
+        stmt = update(StudyStats).where(
+            StudyStats.user_id == user_id,
+            StudyStats.date == date
+        ).values(new_session_count=StudyStats.new_session_count + change)
+    await db.execute(stmt)
+    db.info.setdefault("changed_users", set()).add(user_id)
+
+# Caches keyed on a user's data are dropped only once the write is visible
+@event.listens_for(Session, "after_commit")
+def _notify_changed_users(session: Session):
+    for user_id in session.info.pop("changed_users", ()):
+        notify_user_data_changed(user_id)
+
+@event.listens_for(Session, "after_rollback")
+def _forget_changed_users(session: Session):
+    session.info.pop("changed_users", None)
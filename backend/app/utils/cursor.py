@@ -0,0 +1,19 @@
+from typing import List
+import base64
+
+from fastapi import HTTPException
+
+# Opaque keyset cursors: the sort-key values of the last row, base64-encoded
+
+def encode_cursor(*parts) -> str:
+    return base64.urlsafe_b64encode("\x1f".join(str(p) for p in parts).encode()).decode()
+
+def decode_cursor(cursor: str, size: int = 2) -> List[str]:
+    try:
+        parts = base64.urlsafe_b64decode(cursor.encode()).decode().split("\x1f")
+    except (ValueError, UnicodeDecodeError):
+        parts = []
+    
+    if len(parts) != size:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return parts
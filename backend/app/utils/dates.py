@@ -0,0 +1,63 @@
+from datetime import date, datetime, timedelta, timezone
+from typing import List, Optional, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from fastapi import HTTPException
+
+def parse_zone(tz: str) -> ZoneInfo:
+    try:
+        return ZoneInfo(tz)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise HTTPException(status_code=400, detail=f"Unknown timezone: {tz}")
+
+def utc_offset_minutes(moment: datetime, tz: ZoneInfo) -> int:
+    # moment is a naive UTC datetime, as stored in the database
+    return int(moment.replace(tzinfo=timezone.utc).astimezone(tz).utcoffset().total_seconds() // 60)
+
+def local_midnight_utc(day: date, tz: ZoneInfo) -> datetime:
+    local = datetime(day.year, day.month, day.day, tzinfo=tz)
+    return local.astimezone(timezone.utc).replace(tzinfo=None)
+
+def local_range_utc(start: Optional[date], end: Optional[date], tz: ZoneInfo) -> Tuple[Optional[datetime], Optional[datetime]]:
+    # Local calendar days [start, end] as naive UTC bounds [start_utc, end_utc);
+    # either side may be open. Dates whose bounds a datetime can't hold, in UTC
+    # or back in tz, are rejected rather than overflowing later.
+    try:
+        start_utc = local_midnight_utc(start, tz) if start else None
+        end_utc = local_midnight_utc(end + timedelta(days=1), tz) if end else None
+        for bound in (start_utc, end_utc):
+            if bound is not None:
+                utc_offset_minutes(bound, tz)
+    except OverflowError:
+        raise HTTPException(status_code=400, detail="Date out of range")
+    return start_utc, end_utc
+
+def offset_segments(start: datetime, end: datetime, tz: ZoneInfo) -> List[Tuple[datetime, int]]:
+    # Splits [start, end) into runs with a constant UTC offset. Each entry is
+    # (first UTC instant of the run, offset in minutes). Offsets are probed once
+    # per day and DST transitions are pinned to the second by bisection.
+    offset = utc_offset_minutes(start, tz)
+    segments = [(start, offset)]
+
+    probe = start
+    while probe < end:
+        step = min(probe + timedelta(days=1), end)
+        step_offset = utc_offset_minutes(step, tz)
+
+        if step_offset != offset:
+            lo, hi = probe, step
+            while hi - lo > timedelta(seconds=1):
+                mid = lo + (hi - lo) / 2
+                if utc_offset_minutes(mid, tz) == offset:
+                    lo = mid
+                else:
+                    hi = mid
+            offset = step_offset
+            segments.append((hi.replace(microsecond=0), offset))
+
+        probe = step
+
+    return segments
+
+def date_range(start: date, end: date) -> List[date]:
+    return [start + timedelta(days=i) for i in range((end - start).days + 1)]
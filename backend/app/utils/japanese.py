@@ -0,0 +1,22 @@
+import re
+import unicodedata
+
+_PUNCTUATION = re.compile(r"[\s　、。，．・「」『』（）()\[\]【】〔〕！？!?…〜~'\"“”‘’,.:;：；]+")
+
+_WHITESPACE = re.compile(r"\s+")
+
+def canonical_text(text: str) -> str:
+    # Width-fold and collapse whitespace but keep everything that changes meaning
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFKC", text or "")).strip()
+
+def normalize_text(text: str) -> str:
+    # Width-fold (全角/半角), lowercase and drop whitespace and punctuation
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    return _PUNCTUATION.sub("", text)
+
+def katakana_to_hiragana(text: str) -> str:
+    return "".join(chr(ord(c) - 0x60) if "ァ" <= c <= "ヶ" else c for c in text)
+
+def normalize_answer(text: str) -> str:
+    # Answers compare equal regardless of width, punctuation or katakana/hiragana
+    return katakana_to_hiragana(normalize_text(text))
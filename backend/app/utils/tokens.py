@@ -0,0 +1,24 @@
+import math
+
+# Rough chat-model token counts without a tokenizer dependency. Kana and kanji
+# mostly cost about one token per character; Latin text is closer to four
+# characters per token.
+MESSAGE_OVERHEAD_TOKENS = 4
+
+def _is_wide(ch: str) -> bool:
+    code = ord(ch)
+    return (
+        0x3040 <= code <= 0x30FF      # hiragana, katakana
+        or 0x3400 <= code <= 0x9FFF   # CJK ideographs
+        or 0xF900 <= code <= 0xFAFF
+        or 0xFF00 <= code <= 0xFFEF   # full-width forms
+        or 0x3000 <= code <= 0x303F   # CJK punctuation
+        or 0xAC00 <= code <= 0xD7AF   # hangul
+    )
+
+def estimate_tokens(text: str) -> int:
+    if not text:
+        return 0
+    wide = sum(1 for ch in text if _is_wide(ch))
+    narrow = len(text) - wide
+    return wide + math.ceil(narrow / 4)
@@ -0,0 +1,99 @@
+# Cold-start cost of a worker: importing the app and running the bootstrap.
+#
+# Every run is a fresh interpreter, so module caches don't carry over. "cold"
+# boots against an empty database (schema creation plus seeding); "warm"
+# reuses the database from the previous run, which is what a restarted or
+# scaled-out worker sees. "export" is the extra import time paid the first
+# time /stats/export runs.
+#
+#     python benchmarks/bench_startup.py --runs 10
+from pathlib import Path
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+async def _boot():
+    from app.bootstrap import bootstrap, shutdown
+
+    started = time.perf_counter()
+    await bootstrap()
+    elapsed = time.perf_counter() - started
+    await shutdown()
+    return elapsed
+
+def _run_worker():
+    started = time.perf_counter()
+    import app.main  # noqa: F401
+    import_seconds = time.perf_counter() - started
+
+    boot_seconds = asyncio.run(_boot())
+
+    started = time.perf_counter()
+    import openpyxl  # noqa: F401
+    export_seconds = time.perf_counter() - started
+
+    print(json.dumps({
+        "import_ms": round(import_seconds * 1000, 1),
+        "boot_ms": round(boot_seconds * 1000, 1),
+        "export_import_ms": round(export_seconds * 1000, 1),
+        "openpyxl_at_startup": export_seconds < 0.001
+    }))
+
+def _run_once(db_path):
+    env = dict(
+        os.environ,
+        DATABASE_URL=f"sqlite+aiosqlite:///{db_path}",
+        DB_ECHO="false",
+        OPENAI_API_KEY=os.environ.get("OPENAI_API_KEY", "sk-bench")
+    )
+    result = subprocess.run(
+        [sys.executable, __file__, "--worker"],
+        env=env,
+        cwd=BACKEND_DIR,
+        capture_output=True,
+        text=True,
+        check=True
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description="Import and bootstrap time of a fresh worker")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        _run_worker()
+        return
+
+    cold, warm = [], []
+    with tempfile.TemporaryDirectory() as tmp:
+        for i in range(args.runs):
+            db_path = f"{tmp}/bench.db"
+            for suffix in ("", "-wal", "-shm"):
+                Path(db_path + suffix).unlink(missing_ok=True)
+            cold.append(_run_once(db_path))
+            warm.append(_run_once(db_path))
+
+    print(f"{'phase':<8}{'import ms':>12}{'boot ms':>12}{'export ms':>12}")
+    for name, runs in (("cold", cold), ("warm", warm)):
+        print(
+            f"{name:<8}"
+            f"{round(statistics.median(r['import_ms'] for r in runs), 1):>12}"
+            f"{round(statistics.median(r['boot_ms'] for r in runs), 1):>12}"
+            f"{round(statistics.median(r['export_import_ms'] for r in runs), 1):>12}"
+        )
+    if any(r["openpyxl_at_startup"] for r in cold + warm):
+        print("warning: openpyxl was already imported at startup")
+
+if __name__ == "__main__":
+    main()
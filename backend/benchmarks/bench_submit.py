@@ -0,0 +1,141 @@
+# Concurrent /exercise/submit throughput for each database profile.
+#
+# Each profile runs in a fresh subprocess against its own temporary database,
+# since the engine reads its settings at import time. "baseline" is the old
+# setup (SQLite defaults, a new connection per session); "tuned" is the current
+# default. Answers are multiple choice, so grading stays local and no LLM is
+# involved.
+#
+#     python benchmarks/bench_submit.py --requests 2000 --concurrency 32
+from pathlib import Path
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+PROFILES = {
+    "baseline": {"DB_SQLITE_PROFILE": "default", "DB_POOL_SIZE": "0"},
+    "tuned": {"DB_SQLITE_PROFILE": "tuned"},
+}
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+async def _seed_exercises(grammar_ids, per_grammar):
+    from app.database import AsyncSessionLocal, Exercise
+
+    async with AsyncSessionLocal() as db:
+        exercises = [
+            Exercise(
+                grammar_id=grammar_id,
+                type="choice",
+                question=f"{grammar_id} 問題 {i}",
+                options=["a", "b", "c", "d"],
+                correct_answer="a",
+                explanation=""
+            )
+            for grammar_id in grammar_ids
+            for i in range(per_grammar)
+        ]
+        db.add_all(exercises)
+        await db.commit()
+        return [(e.grammar_id, str(e.id)) for e in exercises]
+
+async def _run_worker(args):
+    import httpx
+    from app.main import app
+    from app.services.grammar_catalog import grammar_catalog
+
+    async with app.router.lifespan_context(app):
+        grammar_ids = [r.id for r in grammar_catalog.filter()][:args.grammar_points]
+        questions = await _seed_exercises(grammar_ids, 5)
+
+        semaphore = asyncio.Semaphore(args.concurrency)
+        latencies = []
+        errors = 0
+
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=60) as client:
+            async def submit(i):
+                nonlocal errors
+                grammar_id, question_id = questions[i % len(questions)]
+                async with semaphore:
+                    started = time.perf_counter()
+                    try:
+                        response = await client.post(
+                            f"/api/exercise/submit?user_id=user_{i % args.users}",
+                            json={"grammarId": grammar_id, "questionId": question_id, "userAnswer": "a" if i % 3 else "b"}
+                        )
+                        if response.status_code != 200:
+                            errors += 1
+                    except Exception:
+                        errors += 1
+                    latencies.append((time.perf_counter() - started) * 1000)
+
+            started = time.perf_counter()
+            await asyncio.gather(*(submit(i) for i in range(args.requests)))
+            elapsed = time.perf_counter() - started
+
+    print(json.dumps({
+        "profile": os.environ.get("BENCH_PROFILE"),
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "seconds": round(elapsed, 3),
+        "throughput": round(args.requests / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies), 1),
+        "p95_ms": round(_percentile(latencies, 95), 1),
+        "p99_ms": round(_percentile(latencies, 99), 1),
+        "errors": errors
+    }))
+
+def _run_profile(profile, args):
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(
+            os.environ,
+            DATABASE_URL=f"sqlite+aiosqlite:///{tmp}/bench.db",
+            DB_ECHO="false",
+            BENCH_PROFILE=profile,
+            OPENAI_API_KEY=os.environ.get("OPENAI_API_KEY", "sk-bench"),
+            **PROFILES[profile]
+        )
+        result = subprocess.run(
+            [sys.executable, __file__, "--worker", *sys.argv[1:]],
+            env=env,
+            cwd=BACKEND_DIR,
+            capture_output=True,
+            text=True,
+            check=True
+        )
+        return json.loads(result.stdout.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent /exercise/submit throughput per database profile")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--grammar-points", type=int, default=10)
+    parser.add_argument("--profiles", default=",".join(PROFILES))
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        asyncio.run(_run_worker(args))
+        return
+
+    print(f"{'profile':<10}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for profile in args.profiles.split(","):
+        r = _run_profile(profile, args)
+        print(f"{r['profile']:<10}{r['throughput']:>10}{r['p50_ms']:>10}{r['p95_ms']:>10}{r['p99_ms']:>10}{r['errors']:>8}")
+
+if __name__ == "__main__":
+    main()
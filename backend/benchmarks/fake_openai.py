@@ -0,0 +1,121 @@
+# OpenAI-compatible stand-in for benchmarks: answers /v1/chat/completions with
+# canned JSON shaped like each prompt expects, after a configurable delay, so
+# load tests never spend real tokens. Point the backend at it with
+# OPENAI_BASE_URL=http://127.0.0.1:9100/v1.
+#
+#     python benchmarks/fake_openai.py --port 9100 --latency 0.3 --jitter 0.1 --error-rate 0.01
+import argparse
+import asyncio
+import json
+import random
+import re
+import time
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+app = FastAPI(title="Fake OpenAI")
+
+config = {
+    "latency": 0.3,
+    "jitter": 0.1,
+    "error_rate": 0.0,
+    "chunk_delay": 0.01,
+}
+stats = {"requests": 0, "errors": 0, "streams": 0}
+
+def _content(prompt: str) -> str:
+    if "逐题判断正误" in prompt:
+        count = len(re.findall(r"^\s*\d+\. 语法点", prompt, re.M))
+        return json.dumps({"results": [
+            {"index": i, "result": random.choice(["correct", "incorrect"]), "explanation": "解析", "suggestion": None}
+            for i in range(1, count + 1)
+        ]}, ensure_ascii=False)
+    if "判断正误" in prompt:
+        return json.dumps({"result": random.choice(["correct", "incorrect"]), "explanation": "解析", "suggestion": None}, ensure_ascii=False)
+    if "练习题" in prompt:
+        return json.dumps({"questions": [
+            {
+                "question": f"練習問題 {random.randrange(10 ** 9)}（　）",
+                "options": ["a", "b", "c", "d"],
+                "correct_answer": "a",
+                "explanation": "解析"
+            }
+            for _ in range(3)
+        ]}, ensure_ascii=False)
+    if "请检查这句日语" in prompt:
+        return json.dumps({"corrected": "自然な文です。", "explanation": "说明", "zh": "翻译"}, ensure_ascii=False)
+    if "摘要" in prompt:
+        return "用户在练习日常会话。"
+    return "はい、そうですね。もう少し詳しく教えてください。"
+
+def _usage(messages, content: str) -> dict:
+    prompt_tokens = sum(len(m.get("content") or "") for m in messages) // 2
+    completion_tokens = len(content) // 2
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens}
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    stats["requests"] += 1
+    await asyncio.sleep(max(0.0, random.gauss(config["latency"], config["jitter"])))
+
+    if random.random() < config["error_rate"]:
+        stats["errors"] += 1
+        return JSONResponse(
+            status_code=500,
+            content={"error": {"message": "Injected failure", "type": "server_error", "code": None}}
+        )
+
+    messages = body.get("messages") or []
+    content = _content((messages[-1].get("content") or "") if messages else "")
+    created = int(time.time())
+
+    if body.get("stream"):
+        stats["streams"] += 1
+
+        async def chunks():
+            for i in range(0, len(content), 4):
+                chunk = {
+                    "id": "chatcmpl-fake",
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": body.get("model"),
+                    "choices": [{"index": 0, "delta": {"content": content[i:i + 4]}, "finish_reason": None}]
+                }
+                yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+                await asyncio.sleep(config["chunk_delay"])
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(chunks(), media_type="text/event-stream")
+
+    return {
+        "id": "chatcmpl-fake",
+        "object": "chat.completion",
+        "created": created,
+        "model": body.get("model"),
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": _usage(messages, content)
+    }
+
+@app.get("/stats")
+async def get_stats():
+    return {**stats, **config}
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI-compatible fake for benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency", type=float, default=config["latency"], help="mean response delay in seconds")
+    parser.add_argument("--jitter", type=float, default=config["jitter"], help="standard deviation of the delay")
+    parser.add_argument("--error-rate", type=float, default=config["error_rate"], help="fraction of calls answered with HTTP 500")
+    parser.add_argument("--chunk-delay", type=float, default=config["chunk_delay"], help="delay between streamed chunks")
+    args = parser.parse_args()
+
+    config.update(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate, chunk_delay=args.chunk_delay)
+
+    import uvicorn
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,326 @@
+# End-to-end load test: starts fake_openai.py and the backend under uvicorn,
+# then drives each scenario with concurrent HTTP clients and reports
+# throughput and p50/p95/p99 latency. Results are written to
+# benchmarks/results/ as JSON tagged with the git commit, and --compare prints
+# the change against an earlier run.
+#
+# Without --database-url it runs against a fresh temporary SQLite database;
+# fill one with seed_data.py first to measure against a large history.
+#
+#     python benchmarks/seed_data.py --users 1000           # DATABASE_URL=... as below
+#     python benchmarks/load_test.py --database-url sqlite+aiosqlite:////tmp/bench.db \
+#         --requests 500 --concurrency 32 --compare benchmarks/results/<earlier>.json
+from pathlib import Path
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import httpx
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+RESULTS_DIR = BACKEND_DIR / "benchmarks" / "results"
+
+DIALOGUE_SCENARIOS = ["greeting", "shopping", "restaurant", "hotel", "direction"]
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+def _git_revision():
+    def git(*args):
+        result = subprocess.run(["git", *args], cwd=BACKEND_DIR, capture_output=True, text=True)
+        return result.stdout.strip() if result.returncode == 0 else None
+
+    return {
+        "commit": git("rev-parse", "HEAD"),
+        "subject": git("log", "-1", "--format=%s"),
+        "dirty": bool(git("status", "--porcelain", "--untracked-files=no"))
+    }
+
+async def _wait_ready(url: str, process: subprocess.Popen, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"{url} exited with code {process.returncode}")
+            try:
+                await client.get(url)
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+class Workload:
+    # Shared state the scenarios draw on: users, grammar points, exercise ids
+    # and one dialogue session per user
+    def __init__(self, client: httpx.AsyncClient, users: int, seed: int):
+        self.client = client
+        self.users = [f"bench_user_{i}" for i in range(users)]
+        self.rng = random.Random(seed)
+        self.grammar_ids = []
+        self.exercises = []
+        self.sessions = {}
+
+    def user(self) -> str:
+        return self.rng.choice(self.users)
+
+    async def prepare(self):
+        response = await self.client.get("/api/grammar/list")
+        response.raise_for_status()
+        self.grammar_ids = [g["id"] for g in response.json()]
+        for grammar_id in self.grammar_ids:
+            response = await self.client.post("/api/exercise/generate", json={"grammarId": grammar_id, "type": "choice"})
+            response.raise_for_status()
+            self.exercises += [(grammar_id, q["id"]) for q in response.json()]
+
+    async def grammar_list(self):
+        return await self.client.get("/api/grammar/list", params={"user_id": self.user()})
+
+    async def exercise_generate(self):
+        return await self.client.post(
+            "/api/exercise/generate",
+            json={"grammarId": self.rng.choice(self.grammar_ids), "type": "choice"}
+        )
+
+    async def exercise_submit(self):
+        grammar_id, question_id = self.rng.choice(self.exercises)
+        return await self.client.post(
+            "/api/exercise/submit",
+            params={"user_id": self.user()},
+            json={"grammarId": grammar_id, "questionId": question_id, "userAnswer": self.rng.choice("abcd")}
+        )
+
+    async def exercise_submit_batch(self):
+        answers = [
+            {"grammarId": grammar_id, "questionId": question_id, "userAnswer": self.rng.choice("abcd")}
+            for grammar_id, question_id in self.rng.sample(self.exercises, min(5, len(self.exercises)))
+        ]
+        return await self.client.post("/api/exercise/submit/batch", params={"user_id": self.user()}, json={"answers": answers})
+
+    async def mistakes(self):
+        return await self.client.get("/api/mistakes", params={"user_id": self.user(), "limit": 50})
+
+    async def recommendations(self):
+        return await self.client.get("/api/recommendations/grammar", params={"user_id": self.user()})
+
+    async def dialogue_turn(self):
+        user = self.user()
+        response = await self.client.post(
+            "/api/dialogue/send",
+            params={"user_id": user},
+            json={
+                "scenarioId": self.rng.choice(DIALOGUE_SCENARIOS),
+                "message": "すみません、駅までの道を教えてください。",
+                "sessionId": self.sessions.get(user)
+            }
+        )
+        if response.status_code == 200:
+            self.sessions[user] = response.json().get("sessionId")
+        return response
+
+    async def dialogue_stream(self):
+        async with self.client.stream(
+            "POST",
+            "/api/dialogue/stream",
+            params={"user_id": self.user()},
+            json={"scenarioId": self.rng.choice(DIALOGUE_SCENARIOS), "message": "こんにちは、よろしくお願いします。"}
+        ) as response:
+            await response.aread()
+            return response
+
+    async def stats_summary(self):
+        return await self.client.get("/api/stats/summary", params={"user_id": self.user()})
+
+    async def stats_weekly(self):
+        return await self.client.get("/api/stats/weekly", params={"user_id": self.user(), "tz": "Asia/Tokyo"})
+
+    async def export(self):
+        # Submit, poll, download: the latency is what a user waits for the file
+        user = self.user()
+        response = await self.client.post("/api/stats/export/jobs", params={"user_id": user})
+        if response.status_code != 200:
+            return response
+        job = response.json()
+        while job["status"] in ("queued", "running"):
+            await asyncio.sleep(0.1)
+            response = await self.client.get(f"/api/stats/export/jobs/{job['jobId']}")
+            if response.status_code != 200:
+                return response
+            job = response.json()
+        return await self.client.get(f"/api/stats/export/jobs/{job['jobId']}/download")
+
+SCENARIOS = [
+    "grammar_list",
+    "exercise_generate",
+    "exercise_submit",
+    "exercise_submit_batch",
+    "mistakes",
+    "recommendations",
+    "dialogue_turn",
+    "dialogue_stream",
+    "stats_summary",
+    "stats_weekly",
+    "export",
+]
+
+async def _run_scenario(workload: Workload, name: str, requests: int, concurrency: int):
+    operation = getattr(workload, name)
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async def one():
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                response = await operation()
+                if response.status_code >= 400:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    elapsed = time.perf_counter() - started
+
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "seconds": round(elapsed, 3),
+        "throughput": round(requests / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies), 1),
+        "p95_ms": round(_percentile(latencies, 95), 1),
+        "p99_ms": round(_percentile(latencies, 99), 1),
+        "errors": errors
+    }
+
+async def _run(args, base_url: str):
+    async with httpx.AsyncClient(
+        base_url=base_url,
+        timeout=120,
+        limits=httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    ) as client:
+        workload = Workload(client, args.users, args.seed)
+        await workload.prepare()
+
+        results = {}
+        for name in args.scenarios.split(","):
+            requests = args.export_requests if name == "export" else args.requests
+            results[name] = await _run_scenario(workload, name, requests, args.concurrency)
+            r = results[name]
+            print(f"{name:<24}{r['throughput']:>10}{r['p50_ms']:>10}{r['p95_ms']:>10}{r['p99_ms']:>10}{r['errors']:>8}")
+
+        response = await client.get("/metrics")
+        return results, response.text if response.status_code == 200 else None
+
+def _compare(results, baseline_path):
+    baseline = json.loads(Path(baseline_path).read_text())
+    print(f"\nvs {baseline['git']['commit'][:10]} ({baseline['git']['subject']})")
+    print(f"{'scenario':<24}{'req/s':>12}{'p50':>12}{'p95':>12}{'p99':>12}")
+    for name, r in results.items():
+        before = baseline["results"].get(name)
+        if not before:
+            continue
+
+        def change(key):
+            if not before[key]:
+                return "n/a"
+            return f"{(r[key] - before[key]) * 100.0 / before[key]:+.1f}%"
+
+        print(f"{name:<24}{change('throughput'):>12}{change('p50_ms'):>12}{change('p95_ms'):>12}{change('p99_ms'):>12}")
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end load test against a fake OpenAI backend")
+    parser.add_argument("--database-url", help="defaults to a fresh temporary SQLite database")
+    parser.add_argument("--requests", type=int, default=300, help="requests per scenario")
+    parser.add_argument("--export-requests", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--users", type=int, default=100, help="bench_user_0..N-1, matching seed_data.py")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--llm-latency", type=float, default=0.3)
+    parser.add_argument("--llm-jitter", type=float, default=0.1)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="result file; defaults to benchmarks/results/<commit>-<time>.json")
+    parser.add_argument("--compare", help="earlier result file to compare against")
+    args = parser.parse_args()
+
+    fake_port, app_port = _free_port(), _free_port()
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(
+            os.environ,
+            DATABASE_URL=args.database_url or f"sqlite+aiosqlite:///{tmp}/load.db",
+            OPENAI_API_KEY="sk-bench",
+            OPENAI_BASE_URL=f"http://127.0.0.1:{fake_port}/v1",
+            DB_ECHO="false",
+            DB_LOG_SAMPLE_RATE="0"
+        )
+        fake = subprocess.Popen(
+            [
+                sys.executable, str(BACKEND_DIR / "benchmarks" / "fake_openai.py"),
+                "--port", str(fake_port),
+                "--latency", str(args.llm_latency),
+                "--jitter", str(args.llm_jitter),
+                "--error-rate", str(args.llm_error_rate)
+            ],
+            cwd=BACKEND_DIR
+        )
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(app_port), "--log-level", "warning"],
+            cwd=BACKEND_DIR,
+            env=env
+        )
+        base_url = f"http://127.0.0.1:{app_port}"
+        try:
+            async def run():
+                await _wait_ready(f"http://127.0.0.1:{fake_port}/stats", fake)
+                await _wait_ready(f"{base_url}/", server)
+                print(f"{'scenario':<24}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+                return await _run(args, base_url)
+
+            results, metrics = asyncio.run(run())
+        finally:
+            for process in (server, fake):
+                process.terminate()
+                process.wait(timeout=30)
+
+    git = _git_revision()
+    report = {
+        "git": git,
+        "created_at": datetime.utcnow().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "args": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+        "results": results,
+        "metrics": metrics
+    }
+    if args.output:
+        output = Path(args.output)
+    else:
+        RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+        output = RESULTS_DIR / f"{(git['commit'] or 'unknown')[:10]}-{datetime.utcnow():%Y%m%d%H%M%S}.json"
+    output.write_text(json.dumps(report, ensure_ascii=False, indent=2))
+    print(f"\nwrote {output}")
+
+    if args.compare:
+        _compare(results, args.compare)
+
+if __name__ == "__main__":
+    main()
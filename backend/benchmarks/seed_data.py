@@ -0,0 +1,235 @@
+# Fills the database named by DATABASE_URL with synthetic study history,
+# spread over the last --days days. Each user gets answers to every grammar
+# point (the wrong ones also written as mistakes), dialogue sessions with
+# their messages, and the practice events, daily study_stats rollups,
+# proficiency and review state those produce, so every endpoint reads a
+# history that adds up. Users are bench_user_0..N-1, which is what
+# load_test.py sends. The same --seed always produces the same data, so runs
+# stay comparable.
+#
+#     DATABASE_URL=sqlite+aiosqlite:///./data/bench.db python benchmarks/seed_data.py --users 10000 --mistakes 2000000
+from pathlib import Path
+from collections import defaultdict
+import argparse
+import asyncio
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+SCENARIOS = ["greeting", "shopping", "restaurant", "hotel", "direction"]
+MASTERED_SCORE = 80
+
+class _Writer:
+    # Buffers rows per table; once any buffer holds a batch, all of them are
+    # inserted together, in table order, in one transaction
+    def __init__(self, engine, tables, batch_size):
+        self.engine = engine
+        self.tables = tables
+        self.batch_size = batch_size
+        self.pending = {name: [] for name in tables}
+        self.totals = dict.fromkeys(tables, 0)
+
+    async def add(self, name, row):
+        self.pending[name].append(row)
+        if len(self.pending[name]) >= self.batch_size:
+            await self.flush()
+
+    async def flush(self):
+        async with self.engine.begin() as conn:
+            for name, rows in self.pending.items():
+                if rows:
+                    await conn.execute(self.tables[name].insert(), rows)
+                    self.totals[name] += len(rows)
+                    self.pending[name] = []
+
+def _share(total, users, u):
+    return total // users + (1 if u < total % users else 0)
+
+def _user_history(rng, user_id, grammar_ids, mistakes, sessions, messages_per_session, now, days):
+    # Yields (table, row) for one user. Answers and dialogue turns are drawn
+    # first; everything else is derived from them in time order the way the
+    # submit and dialogue endpoints would have recorded it.
+    from app.services.review_schedule import DEFAULT_EASE, ReviewState, schedule
+    from app.services.study_stats import STUDY_ACTIVE_GAP_SECONDS, day_start
+
+    horizon = days * 86400
+    minutes_per_session = timedelta(minutes=messages_per_session)
+
+    def moment(earliest=0):
+        return now - timedelta(seconds=rng.randint(earliest, horizon))
+
+    wrong = defaultdict(int)
+    for _ in range(mistakes):
+        wrong[rng.choice(grammar_ids)] += 1
+    answers = []
+    for grammar_id in grammar_ids:
+        accuracy = rng.uniform(0.3, 0.95)
+        right = max(round(wrong[grammar_id] * accuracy / (1 - accuracy)), 0 if wrong[grammar_id] else 1)
+        outcomes = [False] * wrong[grammar_id] + [True] * right
+        answers += [(moment(), grammar_id, correct) for correct in outcomes]
+    answers.sort()
+
+    rollups = defaultdict(lambda: defaultdict(int))
+    activity = []
+    practiced = {}
+
+    for at, grammar_id, correct in answers:
+        day = rollups[day_start(at)]
+        previous = practiced.get(grammar_id)
+        count, right, review, _ = previous or (0, 0, ReviewState(DEFAULT_EASE, 0.0, 0, at), None)
+        was_mastered = count > 0 and right * 100.0 / count >= MASTERED_SCORE
+        count, right = count + 1, right + int(correct)
+        practiced[grammar_id] = (count, right, schedule(review, correct, at), at)
+
+        day["grammar_count"] += 1
+        day["mistake_count"] += 0 if correct else 1
+        day["mastered_count"] += int(right * 100.0 / count >= MASTERED_SCORE) - int(was_mastered)
+        day["new_grammar_count"] += 0 if previous else 1
+        activity.append(at)
+
+        yield "practice_events", {
+            "user_id": user_id, "kind": "grammar", "grammar_id": grammar_id, "session_id": None, "correct": correct, "created_at": at
+        }
+        if not correct:
+            yield "mistakes", {
+                "user_id": user_id,
+                "grammar_id": grammar_id,
+                "question_id": str(rng.randint(1, 100000)),
+                "user_answer": rng.choice(["a", "b", "c", "d"]),
+                "correct_answer": "a",
+                "timestamp": at
+            }
+
+    for grammar_id, (count, right, review, last_practiced) in practiced.items():
+        yield "user_proficiency", {
+            "user_id": user_id,
+            "grammar_id": grammar_id,
+            "practice_count": count,
+            "correct_count": right,
+            "proficiency_score": right * 100.0 / count,
+            "last_practiced": last_practiced,
+            "ease": review.ease,
+            "interval_days": review.interval_days,
+            "repetitions": review.repetitions,
+            "due_at": review.due_at
+        }
+
+    for _ in range(sessions):
+        session_id = str(uuid.UUID(int=rng.getrandbits(128)))
+        created_at = moment(int(minutes_per_session.total_seconds()))
+        rollups[day_start(created_at)]["new_session_count"] += 1
+        yield "dialogue_sessions", {
+            "id": session_id,
+            "user_id": user_id,
+            "scenario": rng.choice(SCENARIOS),
+            "history": None,
+            "message_count": messages_per_session,
+            "summarized_through_seq": 0,
+            "created_at": created_at,
+            "updated_at": created_at + minutes_per_session
+        }
+
+        for seq in range(1, messages_per_session + 1):
+            at = created_at + timedelta(minutes=seq)
+            yield "dialogue_messages", {
+                "session_id": session_id,
+                "seq": seq,
+                "role": "user" if seq % 2 else "assistant",
+                "text": "すみません、駅はどこですか。" if seq % 2 else "まっすぐ行って、右に曲がってください。",
+                "created_at": at
+            }
+            if seq % 2:
+                rollups[day_start(at)]["dialogue_count"] += 1
+                activity.append(at)
+                yield "practice_events", {
+                    "user_id": user_id, "kind": "dialogue", "grammar_id": None, "session_id": session_id, "correct": None, "created_at": at
+                }
+
+    # Study time is the sum of gaps between same-day activities that are
+    # close enough to count as one sitting
+    last_activity = {}
+    for at in sorted(activity):
+        date = day_start(at)
+        previous = last_activity.get(date)
+        if previous is not None and (at - previous).total_seconds() <= STUDY_ACTIVE_GAP_SECONDS:
+            rollups[date]["total_time_seconds"] += int((at - previous).total_seconds())
+        last_activity[date] = at
+
+    for date, counts in sorted(rollups.items()):
+        yield "study_stats", {
+            "user_id": user_id,
+            "date": date,
+            "grammar_count": counts["grammar_count"],
+            "dialogue_count": counts["dialogue_count"],
+            "mistake_count": counts["mistake_count"],
+            "mastered_count": counts["mastered_count"],
+            "new_grammar_count": counts["new_grammar_count"],
+            "new_session_count": counts["new_session_count"],
+            "total_time_seconds": counts["total_time_seconds"],
+            "total_time_minutes": counts["total_time_seconds"] // 60,
+            "last_activity_at": last_activity.get(date, date)
+        }
+
+async def _seed(args):
+    from app.bootstrap import seed_grammar
+    from app.database import engine, DialogueMessage, DialogueSession, Mistake, PracticeEvent, StudyStats, UserProficiency
+    from app.migrations import run_migrations
+    from app.services.grammar_catalog import grammar_catalog
+
+    await run_migrations(engine)
+    await seed_grammar()
+    grammar_ids = [r.id for r in grammar_catalog.filter()]
+
+    rng = random.Random(args.seed)
+    now = datetime.utcnow()
+    started = time.perf_counter()
+    writer = _Writer(engine, {
+        "user_proficiency": UserProficiency.__table__,
+        "mistakes": Mistake.__table__,
+        "practice_events": PracticeEvent.__table__,
+        "dialogue_sessions": DialogueSession.__table__,
+        "dialogue_messages": DialogueMessage.__table__,
+        "study_stats": StudyStats.__table__,
+    }, args.batch_size)
+
+    for u in range(args.users):
+        history = _user_history(
+            rng, f"bench_user_{u}", grammar_ids,
+            _share(args.mistakes, args.users, u),
+            _share(args.sessions, args.users, u),
+            args.messages_per_session, now, args.days
+        )
+        for table, row in history:
+            await writer.add(table, row)
+        print(f"\rusers: {u + 1:,}/{args.users:,}", end="", flush=True)
+    await writer.flush()
+
+    print(f"\rseeded {args.users:,} users in {time.perf_counter() - started:.1f}s")
+    for name, total in writer.totals.items():
+        print(f"{name}: {total:,} rows")
+
+    if engine.dialect.name == "sqlite":
+        async with engine.begin() as conn:
+            await conn.exec_driver_sql("ANALYZE")
+    await engine.dispose()
+
+def main():
+    parser = argparse.ArgumentParser(description="Fill the database with synthetic study history")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--mistakes", type=int, default=1_000_000, help="wrong answers across all users; right ones are added per grammar point")
+    parser.add_argument("--sessions", type=int, default=100_000)
+    parser.add_argument("--messages-per-session", type=int, default=10)
+    parser.add_argument("--days", type=int, default=180)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    asyncio.run(_seed(args))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+import asyncio
+import json
+
+from sqlalchemy import inspect, text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.migrations import MIGRATIONS, run_migrations
+
+# Schema as it shipped before versioned migrations existed
+BASELINE_SCHEMA = [
+    """CREATE TABLE grammar (
+        id VARCHAR NOT NULL PRIMARY KEY, level VARCHAR, title VARCHAR, structure VARCHAR,
+        usage TEXT, examples JSON, themes JSON
+    )""",
+    """CREATE TABLE exercises (
+        id INTEGER NOT NULL PRIMARY KEY, grammar_id VARCHAR, type VARCHAR, question TEXT,
+        options JSON, correct_answer VARCHAR, explanation TEXT, created_at DATETIME
+    )""",
+    """CREATE TABLE mistakes (
+        id INTEGER NOT NULL PRIMARY KEY, user_id VARCHAR, grammar_id VARCHAR, question_id VARCHAR,
+        user_answer TEXT, correct_answer TEXT, timestamp DATETIME
+    )""",
+    """CREATE TABLE user_proficiency (
+        id INTEGER NOT NULL PRIMARY KEY, user_id VARCHAR, grammar_id VARCHAR, practice_count INTEGER,
+        correct_count INTEGER, proficiency_score FLOAT, last_practiced DATETIME
+    )""",
+    """CREATE TABLE dialogue_sessions (
+        id VARCHAR NOT NULL PRIMARY KEY, user_id VARCHAR, scenario VARCHAR, history JSON,
+        created_at DATETIME, updated_at DATETIME
+    )""",
+    """CREATE TABLE study_stats (
+        id INTEGER NOT NULL PRIMARY KEY, user_id VARCHAR, date DATETIME, grammar_count INTEGER,
+        dialogue_count INTEGER, total_time_minutes INTEGER
+    )""",
+]
+
+BASELINE_ROWS = [
+    "INSERT INTO grammar (id, level, title) VALUES ('n5_001', 'N5', 'です')",
+    "INSERT INTO mistakes (user_id, grammar_id, question_id, user_answer, correct_answer, timestamp)"
+    " VALUES ('u1', 'n5_001', '1', 'a', 'b', '2024-05-01 10:00:00.000000')",
+    # Duplicate (user, grammar) rows, which the unique key in 001 has to merge
+    "INSERT INTO user_proficiency (user_id, grammar_id, practice_count, correct_count, proficiency_score, last_practiced)"
+    " VALUES ('u1', 'n5_001', 4, 2, 50.0, '2024-05-01 10:00:00.000000')",
+    "INSERT INTO user_proficiency (user_id, grammar_id, practice_count, correct_count, proficiency_score, last_practiced)"
+    " VALUES ('u1', 'n5_001', 6, 6, 100.0, '2024-05-02 10:00:00.000000')",
+    "INSERT INTO dialogue_sessions (id, user_id, scenario, history, created_at, updated_at)"
+    " VALUES ('s1', 'u1', 'greeting', :history, '2024-05-01 10:00:00.000000', '2024-05-01 10:05:00.000000')",
+]
+
+def _upgrade(path):
+    async def run():
+        engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+        try:
+            async with engine.begin() as conn:
+                for statement in BASELINE_SCHEMA:
+                    await conn.execute(text(statement))
+                history = json.dumps([
+                    {"role": "user", "text": "こんにちは"},
+                    {"role": "assistant", "text": "こんにちは！"}
+                ])
+                for statement in BASELINE_ROWS:
+                    await conn.execute(text(statement), {"history": history})
+
+            await run_migrations(engine)
+            # A second start finds nothing left to do
+            await run_migrations(engine)
+
+            async with engine.connect() as conn:
+                return await conn.run_sync(_snapshot)
+        finally:
+            await engine.dispose()
+
+    return asyncio.run(run())
+
+def _snapshot(conn):
+    inspector = inspect(conn)
+    return {
+        "versions": [r[0] for r in conn.execute(text("SELECT version FROM schema_version ORDER BY version"))],
+        "columns": {t: {c["name"] for c in inspector.get_columns(t)} for t in inspector.get_table_names()},
+        "indexes": {t: {i["name"] for i in inspector.get_indexes(t)} for t in inspector.get_table_names()},
+        "proficiency": conn.execute(text(
+            "SELECT practice_count, correct_count, ease, interval_days, repetitions, due_at FROM user_proficiency"
+        )).all(),
+        "messages": conn.execute(text("SELECT seq, role, text FROM dialogue_messages ORDER BY seq")).all(),
+        "message_count": conn.execute(text("SELECT message_count FROM dialogue_sessions")).scalar(),
+        "study_stats": conn.execute(text("SELECT user_id, mistake_count, new_session_count FROM study_stats")).all(),
+    }
+
+def test_baseline_database_upgrades_through_every_migration(tmp_path):
+    snapshot = _upgrade(tmp_path / "baseline.db")
+
+    assert snapshot["versions"] == [version for version, _, _ in MIGRATIONS]
+
+    assert {"ease", "interval_days", "repetitions", "due_at"} <= snapshot["columns"]["user_proficiency"]
+    assert {"message_count", "summary", "summarized_through_seq"} <= snapshot["columns"]["dialogue_sessions"]
+    assert {"mistake_count", "total_time_seconds", "last_activity_at"} <= snapshot["columns"]["study_stats"]
+    for table in ("practice_events", "dialogue_messages", "llm_cache", "export_jobs", "dialogue_corrections"):
+        assert table in snapshot["columns"]
+
+    assert snapshot["indexes"]["mistakes"] == {"ix_mistakes_user_timestamp", "ix_mistakes_user_grammar_timestamp"}
+    assert snapshot["indexes"]["user_proficiency"] == {
+        "uq_user_proficiency_user_grammar",
+        "ix_user_proficiency_user_score",
+        "ix_user_proficiency_user_practiced",
+        "ix_user_proficiency_user_due",
+    }
+    assert "uq_study_stats_user_date" in snapshot["indexes"]["study_stats"]
+    assert "uq_dialogue_messages_session_seq" in snapshot["indexes"]["dialogue_messages"]
+
+    [(practice_count, correct_count, ease, interval_days, repetitions, due_at)] = snapshot["proficiency"]
+    assert (practice_count, correct_count) == (10, 8)
+    assert (ease, interval_days, repetitions) == (2.5, 0.0, 0)
+    assert due_at is not None
+
+    assert snapshot["messages"] == [(1, "user", "こんにちは"), (2, "assistant", "こんにちは！")]
+    assert snapshot["message_count"] == 2
+    assert ("u1", 1, 1) in snapshot["study_stats"]
+
+def test_fresh_database_is_stamped_at_latest_version(tmp_path):
+    async def run():
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'fresh.db'}")
+        try:
+            await run_migrations(engine)
+            async with engine.connect() as conn:
+                return await conn.run_sync(_snapshot)
+        finally:
+            await engine.dispose()
+
+    snapshot = asyncio.run(run())
+    assert snapshot["versions"] == [version for version, _, _ in MIGRATIONS]
+    assert "ix_user_proficiency_user_due" in snapshot["indexes"]["user_proficiency"]
@@ -39,25 +39,36 @@ const DialogueChat: React.FC = () => {
     setInputText('');
     setLoading(true);
 
-    try {
-      const response = await dialogueAPI.sendMessage(scenario!, inputText, sessionId);
-      
-      if (!sessionId) {
-        setSessionId(response.sessionId);
-      }
+    const userIndex = messages.length;
+    const aiIndex = userIndex + 1;
 
-      const updatedMessages = [...messages, userMessage];
-      
-      if (response.correction && showCorrections) {
-        updatedMessages[updatedMessages.length - 1].correction = response.correction;
-      }
+    const updateMessage = (index: number, update: (message: Message) => Message) => {
+      setMessages(prev => {
+        const next = [...prev];
+        next[index] = update(next[index] ?? { role: 'assistant', text: '' });
+        return next;
+      });
+    };
 
-      const aiMessage: Message = {
-        role: 'assistant',
-        text: response.reply,
-      };
-      
-      setMessages([...updatedMessages, aiMessage]);
+    try {
+      await dialogueAPI.streamMessage(scenario!, inputText, sessionId || undefined, {
+        onSession: id => {
+          if (!sessionId) {
+            setSessionId(id);
+          }
+        },
+        onToken: text => updateMessage(aiIndex, m => ({ ...m, text: m.text + text })),
+        onReply: reply => updateMessage(aiIndex, m => ({ ...m, text: reply })),
+        onCorrection: event => {
+          if (!showCorrections) return;
+          if (event.correction) {
+            const correction = event.correction;
+            updateMessage(userIndex, m => ({ ...m, correction }));
+          } else if (event.correctionPending && event.correctionId) {
+            attachLateCorrection(event.correctionId, userIndex);
+          }
+        },
+      });
     } catch (error) {
       console.error('Failed to send message:', error);
     } finally {
@@ -65,6 +76,18 @@ const DialogueChat: React.FC = () => {
     }
   };
 
+  const attachLateCorrection = async (correctionId: string, index: number) => {
+    try {
+      const result = await dialogueAPI.getCorrection(correctionId);
+      if (result.status === 'done' && result.correction) {
+        const correction = result.correction;
+        setMessages(prev => prev.map((m, i) => (i === index ? { ...m, correction } : m)));
+      }
+    } catch (error) {
+      console.error('Failed to fetch correction:', error);
+    }
+  };
+
   const handleKeyPress = (e: React.KeyboardEvent) => {
     if (e.key === 'Enter' && !e.shiftKey) {
       e.preventDefault();
@@ -52,6 +52,19 @@ export interface Correction {
   zh: string;
 }
 
+export interface CorrectionEvent {
+  correction: Correction | null;
+  correctionPending: boolean;
+  correctionId?: string;
+}
+
+export interface DialogueStreamHandlers {
+  onSession?: (sessionId: string) => void;
+  onToken?: (text: string) => void;
+  onReply?: (reply: string) => void;
+  onCorrection?: (event: CorrectionEvent) => void;
+}
+
 export interface MistakeDetail {
   id: number;
   grammarId: string;
@@ -74,6 +87,15 @@ export interface WeeklyStats {
   totalDialogue: number;
 }
 
+export interface ExportJob {
+  jobId: string;
+  status: 'queued' | 'running' | 'done' | 'failed';
+  rowsWritten: number;
+  rowsTotal: number | null;
+  progress: number;
+  error: string | null;
+}
+
 export const grammarAPI = {
   list: async (level?: string, theme?: string) => {
     const params = new URLSearchParams();
@@ -141,6 +163,60 @@ export const dialogueAPI = {
     return response.data;
   },
 
+  streamMessage: async (
+    scenarioId: string,
+    message: string,
+    sessionId: string | undefined,
+    handlers: DialogueStreamHandlers
+  ) => {
+    const response = await fetch(`${API_BASE_URL}/dialogue/stream`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ scenarioId, message, sessionId }),
+    });
+    if (!response.ok || !response.body) {
+      throw new Error(`Dialogue stream failed with status ${response.status}`);
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    for (;;) {
+      const { done, value } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+
+      let boundary = buffer.indexOf('\n\n');
+      while (boundary !== -1) {
+        const block = buffer.slice(0, boundary);
+        buffer = buffer.slice(boundary + 2);
+        boundary = buffer.indexOf('\n\n');
+
+        let event = 'message';
+        let data = '';
+        for (const line of block.split('\n')) {
+          if (line.startsWith('event: ')) event = line.slice(7);
+          else if (line.startsWith('data: ')) data += line.slice(6);
+        }
+        if (!data) continue;
+
+        const payload = JSON.parse(data);
+        if (event === 'session') handlers.onSession?.(payload.sessionId);
+        else if (event === 'token') handlers.onToken?.(payload.text);
+        else if (event === 'reply') handlers.onReply?.(payload.reply);
+        else if (event === 'correction') handlers.onCorrection?.(payload);
+      }
+    }
+  },
+
+  getCorrection: async (correctionId: string, wait = 10) => {
+    const response = await api.get<{ status: 'pending' | 'done'; correction: Correction | null }>(
+      `/dialogue/correction/${correctionId}?wait=${wait}`
+    );
+    return response.data;
+  },
+
   correctMessage: async (message: string) => {
     const response = await api.post<Correction>('/dialogue/correct', {
       message,
@@ -156,12 +232,25 @@ export const dialogueAPI = {
 
 export const statsAPI = {
   getWeeklyStats: async () => {
-    const response = await api.get<WeeklyStats>('/stats/weekly');
+    const tz = Intl.DateTimeFormat().resolvedOptions().timeZone;
+    const response = await api.get<WeeklyStats>(`/stats/weekly?tz=${encodeURIComponent(tz)}`);
     return response.data;
   },
 
-  exportData: async () => {
-    const response = await api.get('/stats/export', {
+  exportData: async (onProgress?: (job: ExportJob) => void) => {
+    // Large accounts export in the background; poll until the file is ready
+    let job = (await api.post<ExportJob>('/stats/export/jobs')).data;
+    while (job.status === 'queued' || job.status === 'running') {
+      onProgress?.(job);
+      await new Promise(resolve => setTimeout(resolve, 1000));
+      job = (await api.get<ExportJob>(`/stats/export/jobs/${job.jobId}`)).data;
+    }
+    if (job.status === 'failed') {
+      throw new Error(job.error || 'Export failed');
+    }
+    onProgress?.(job);
+
+    const response = await api.get(`/stats/export/jobs/${job.jobId}/download`, {
       responseType: 'blob',
     });
     const url = window.URL.createObjectURL(new Blob([response.data]));